@@ -1,81 +1,289 @@
 import asyncio
 import logging
+from contextlib import asynccontextmanager
+
 import aiohttp
-from aiolimiter import AsyncLimiter
+
+from async_colab_module.breaker import CircuitBreaker, CircuitBreakerRegistry
+from async_colab_module.cache import ResponseCache, response_cache
+from async_colab_module.codec import JsonCodec, default_codec
+from async_colab_module.json_stream import JsonArrayStream
+from async_colab_module.limiter import RateLimiterRegistry
+from async_colab_module.metrics import RequestMetrics, Timer
+from async_colab_module.retry import RetryPolicy
+from async_colab_module.scheduler import PrioritySemaphore
+from async_colab_module.session import SessionRegistry, shared_sessions
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('API')
 
 
+class ApiResponseError(aiohttp.ClientResponseError):
+    """Ответ API с ошибкой; body - разобранное тело ответа ошибки запроса 4xx (errorText и т.п.) или None"""
+
+    def __init__(self, *args, body=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.body = body
+
+
+class IncompleteDataError(Exception):
+    """Постраничная выгрузка прервалась на сбойной странице: полученные данные неполные"""
+
+
 class AsyncHttpClient:
+    # Время жизни кэша ответов по эндпоинтам: {часть url: секунд}
+    cache_ttls = {}
+    # Лимиты отдельных хостов: {хост: (запросов, секунд)}
+    host_limits = {}
+
     def __init__(self, max_rete: int, time_period: int, semaphore: int = 5,
-                 max_retries: int = 3, delay_seconds: int = 10):
-        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False),
-                                             timeout=aiohttp.ClientTimeout(total=60))
+                 max_retries: int = 3, delay_seconds: float = 1, host_limits: dict = None,
+                 retry_policy: RetryPolicy = None, session_registry: SessionRegistry = None,
+                 cache: ResponseCache = None, cache_ttls: dict = None, codec: JsonCodec = None,
+                 metrics: RequestMetrics = None, url_map: dict = None, breakers: CircuitBreakerRegistry = None):
+        # Сессия берется из общего пула процесса при первом запросе
+        self.session_registry = session_registry or shared_sessions
+        self._session = None
         self.headers = {'Content-Type': 'application/json'}
-        # Ограничитель для 45 запросов каждые 3 секунды
-        self.rate_limiter = AsyncLimiter(max_rete, time_period)
-        # Ограничитель для не более semaphore параллельных запросов
-        self.semaphore = asyncio.Semaphore(semaphore)
-        # Три попытки при ошибке, через 10 секунд
-        self.max_retries = max_retries
-        self.delay_seconds = delay_seconds
-
-    async def handle_request_errors(self, func, *args, **kwargs):
-        for attempt in range(self.max_retries):
-            try:
-                return await func(*args, **kwargs)
-            except aiohttp.ClientResponseError as e:
-                if attempt < self.max_retries - 1:
-                    logger.error(f'Неудачный запрос, ошибка: {e}. Повтор через {self.delay_seconds} секунд.')
-                    await asyncio.sleep(self.delay_seconds)
-                else:
-                    logger.error(
-                        f'Достигнуто максимальное количество попыток ({self.max_retries}). '
-                        f'Прекращение повторных запросов.')
+        # Ограничитель для 45 запросов каждые 3 секунды, отдельный на каждый хост.
+        # Частота подстраивается по заголовкам X-RateLimit-*/Retry-After из ответов API
+        self.rate_limiters = RateLimiterRegistry(max_rete, time_period,
+                                                 host_limits={**self.host_limits, **(host_limits or {})})
+        # Ограничитель для не более semaphore параллельных запросов. Очередь упорядочена по приоритету
+        # (scheduler.request_priority): интерактивные запросы обгоняют фоновую выгрузку
+        self.semaphore = PrioritySemaphore(semaphore)
+        # Три попытки при ошибке 429/5xx, таймауте или обрыве соединения,
+        # пауза растет экспоненциально от delay_seconds со случайным разбросом
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=max_retries, base_delay=delay_seconds)
+        # Справочные ответы (тарифы, комиссии) кэшируются, по умолчанию в общем кэше процесса
+        self.cache = cache if cache is not None else response_cache
+        if cache_ttls is not None:
+            self.cache_ttls = {**self.cache_ttls, **cache_ttls}
+        # Кодирование тел запросов и разбор ответов (orjson, если установлен)
+        self.codec = codec or default_codec
+        # Время ответа, ожидания семафора и лимита, повторы и объем ответов по эндпоинтам
+        self.metrics = metrics if metrics is not None else RequestMetrics()
+        # Предохранители хостов: при серии сбоев запросы к хосту отклоняются сразу, без ожидания повторов
+        self.breakers = breakers if breakers is not None else CircuitBreakerRegistry()
+        # Подмена адресов API, например на локальный стенд: {'https://api.moysklad.ru': 'http://127.0.0.1:8080/ms'}
+        self.url_map = url_map or {}
+        # Выполняющиеся GET-запросы: одинаковые параллельные вызовы ждут один общий запрос
+        self._inflight = {}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = self.session_registry.acquire()
+        return self._session
+
+    async def handle_request_errors(self, func, *args, retry_policy: RetryPolicy = None, **kwargs):
+        policy = retry_policy or self.retry_policy
+
+        def log_retry(error, attempt, delay):
+            # func вызывается как func(method, url, ...)
+            if len(args) > 1:
+                self.metrics.count(args[1], 'retries')
+            logger.error(f'Неудачный запрос, ошибка: {str(error) or repr(error)}. Повтор через {delay:.1f} секунд.')
+
+        try:
+            return await policy.call(lambda: func(*args, **kwargs), on_retry=log_retry)
+        except Exception as e:
+            if not isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)):
+                raise
+            if policy.is_retryable(e):
+                logger.error(f'Исчерпаны попытки повторных запросов ({policy.max_attempts}), ошибка: {str(e) or repr(e)}. '
+                             f'Прекращение повторных запросов.')
+            else:
+                logger.error(f'Неудачный запрос, ошибка: {str(e) or repr(e)}. Повтор не выполняется.')
         return None
 
-    async def get(self, url, params=None):
-        return await self.handle_request_errors(self._get, url, params=params)
-
-    async def post(self, url, data):
-        return await self.handle_request_errors(self._post, url, json=data)
-
-    async def put(self, url, data):
-        return await self.handle_request_errors(self._put, url, json=data)
-
-    async def delete(self, url):
-        return await self.handle_request_errors(self._delete, url)
-
-    async def _get(self, url, params=None):
-        async with self.semaphore:
-            async with self.rate_limiter:
-                async with self.session.get(url, headers=self.headers, params=params) as response:
-                    if not response.ok:
-                        raise aiohttp.ClientResponseError(history=response.history, status=response.status,
-                                                          message=response.reason, request_info=response.request_info)
-                    return await response.json()
-
-    async def _post(self, url, json):
-        async with self.semaphore:
-            async with self.rate_limiter:
-                async with self.session.post(url, headers=self.headers, json=json) as response:
-                    return await response.json()
-
-    async def _put(self, url, json):
-        async with self.semaphore:
-            async with self.rate_limiter:
-                async with self.session.put(url, headers=self.headers, json=json) as response:
-                    return await response.json()
-
-    async def _delete(self, url):
-        async with self.semaphore:
-            async with self.rate_limiter:
-                async with self.session.delete(url, headers=self.headers) as response:
-                    return await response.json()
+    @staticmethod
+    def request_key(method, url, params=None):
+        items = params.items() if isinstance(params, dict) else (params or ())
+        return method, str(url), tuple(sorted((str(key), str(value)) for key, value in items))
+
+    async def single_flight(self, key, request):
+        """Объединяет одинаковые параллельные запросы в один, результат получают все ожидающие"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(request())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.pop(key, None)
+                                   if self._inflight.get(key) is done else None)
+        # shield - отмена одного из ожидающих не отменяет запрос для остальных
+        return await asyncio.shield(task)
+
+    def get_cache_ttl(self, url):
+        url = str(url)
+        return max((ttl for pattern, ttl in self.cache_ttls.items() if pattern in url), default=None)
+
+    async def cached(self, method, url, request, params=None, data=None, cache_ttl: float = None):
+        """Возвращает ответ из кэша или выполняет request() и кэширует результат на cache_ttl секунд"""
+        ttl = self.get_cache_ttl(url) if cache_ttl is None else cache_ttl
+        if not ttl or self.cache is None:
+            return await request()
+        key = self.cache.make_key(method, url, params, data, self.headers.get('Authorization'))
+        result = self.cache.get(key)
+        if result is None:
+            result = await request()
+            if result is not None:
+                self.cache.set(key, url, result, ttl)
+        return result
+
+    def invalidate_cache(self, pattern: str = None):
+        if self.cache is not None:
+            self.cache.invalidate(pattern)
+
+    async def get(self, url, params=None, retry_policy: RetryPolicy = None, cache_ttl: float = None):
+        return await self.cached('GET', url, lambda: self.single_flight(
+            self.request_key('GET', url, params),
+            lambda: self.handle_request_errors(self._request, 'GET', url, params=params, retry_policy=retry_policy)),
+            params=params, cache_ttl=cache_ttl)
+
+    async def get_direct(self, url, params=None, retry_policy: RetryPolicy = None):
+        """GET без кэша и объединения одинаковых запросов: отмена вызывающего останавливает сам запрос.
+        Для страниц, запрошенных наперед, которые могут оказаться не нужны"""
+        return await self.handle_request_errors(self._request, 'GET', url, params=params, retry_policy=retry_policy)
+
+    async def post(self, url, data, retry_policy: RetryPolicy = None, cache_ttl: float = None):
+        return await self.cached('POST', url, lambda: self.handle_request_errors(
+            self._request, 'POST', url, json=data, retry_policy=retry_policy), data=data, cache_ttl=cache_ttl)
+
+    async def put(self, url, data, retry_policy: RetryPolicy = None):
+        return await self.handle_request_errors(self._request, 'PUT', url, json=data, retry_policy=retry_policy)
+
+    async def delete(self, url, retry_policy: RetryPolicy = None):
+        return await self.handle_request_errors(self._request, 'DELETE', url, retry_policy=retry_policy)
+
+    @staticmethod
+    def raise_for_status(response, body=None):
+        if not response.ok:
+            raise ApiResponseError(history=response.history, status=response.status,
+                                   message=response.reason, headers=response.headers,
+                                   request_info=response.request_info, body=body)
+
+    async def read_error_body(self, response):
+        """Тело ответа с ошибкой запроса 4xx: API сообщает в нем причину отказа"""
+        if response.ok or response.status >= 500:
+            return None
+        try:
+            return self.codec.loads(await response.read())
+        except ValueError:
+            return None
+
+    def rewrite_url(self, url) -> str:
+        url = str(url)
+        for origin, target in self.url_map.items():
+            if url.startswith(origin):
+                return target + url[len(origin):]
+        return url
+
+    async def acquire_slot(self, limiter):
+        """Занимает место в общем семафоре. Если хост приостановили, пока ждали место,
+        место на время паузы отдается запросам к другим хостам"""
+        await self.semaphore.acquire()
+        while limiter.is_paused():
+            self.semaphore.release()
+            await limiter.wait_pause()
+            await self.semaphore.acquire()
+
+    @asynccontextmanager
+    async def send(self, method, url, **kwargs):
+        """Отправляет запрос с учетом лимита хоста и семафора и отдает проверенный ответ"""
+        stats = self.metrics.get_stats(url)
+        breaker = self.breakers.get(url)
+        breaker.check()
+        limiter = self.rate_limiters.get(url)
+        timer = Timer()
+        # Пауза и лимит хоста ждутся до общего семафора: запросы к приостановленному хосту (429,
+        # Retry-After, лимит statistics-api) не занимают места, нужные запросам к другим хостам
+        async with limiter:
+            stats.histograms['limiter_wait'].observe(timer.lap())
+            await self.acquire_slot(limiter)
+            stats.histograms['queue_wait'].observe(timer.lap())
+            try:
+                # Проверяем после ожидания очереди: за это время хост мог быть признан недоступным
+                probe = breaker.before_request()
+                stats.counters['requests'] += 1
+                try:
+                    async with self.session.request(method, self.rewrite_url(url), headers=self.headers,
+                                                    **kwargs) as response:
+                        stats.statuses[response.status] = stats.statuses.get(response.status, 0) + 1
+                        self.rate_limiters.update(url, response.status, response.headers)
+                        if response.status < 500:
+                            breaker.record_success()
+                        self.raise_for_status(response, await self.read_error_body(response))
+                        yield response
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    stats.counters['errors'] += 1
+                    if CircuitBreaker.is_failure(e):
+                        breaker.record_failure()
+                    raise
+                finally:
+                    # Пробный запрос без итога (отмена, ошибка не из числа сбоев) не должен занимать место навсегда
+                    breaker.release_probe(probe)
+                    stats.histograms['latency'].observe(timer.lap())
+            finally:
+                self.semaphore.release()
+
+    async def _request(self, method, url, json=None, **kwargs):
+        if json is not None:
+            kwargs['data'] = self.codec.dumps(json)
+        async with self.send(method, url, **kwargs) as response:
+            body = await response.read()
+            self.metrics.count(url, 'bytes_received', len(body))
+            if not body.strip():
+                return None
+            try:
+                return self.codec.loads(body)
+            except ValueError as e:
+                raise aiohttp.ContentTypeError(response.request_info, response.history, status=response.status,
+                                               message=f'Ответ не является JSON: {e}', headers=response.headers)
+
+    async def iter_json(self, url, params=None, key: str = None, project=None, chunk_size: int = 64 * 1024,
+                        raise_errors: bool = False):
+        """Потоково разбирает JSON-массив ответа (весь ответ или поле key) и отдает записи по мере загрузки.
+
+        project - функция проекции записи, чтобы в памяти оставались только нужные поля.
+        Повтор выполняется, только пока не отдана первая запись. raise_errors - после неудачных повторов
+        поднять ошибку, а не просто закончить выдачу: иначе сбой не отличить от пустого ответа.
+        """
+        policy = self.retry_policy
+        waited = 0.0
+        for attempt in range(policy.max_attempts):
+            started = False
+            try:
+                async with self.send('GET', url, params=params) as response:
+                    stats = self.metrics.get_stats(url)
+                    parser = JsonArrayStream(key)
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        stats.counters['bytes_received'] += len(chunk)
+                        for item in parser.feed(chunk):
+                            started = True
+                            yield project(item) if project else item
+                    for item in parser.close():
+                        yield project(item) if project else item
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if started:
+                    # Часть записей уже отдана - неполные данные нельзя выдавать за полные
+                    raise
+                delay = policy.get_delay(attempt, e)
+                if (not policy.is_retryable(e) or attempt == policy.max_attempts - 1
+                        or waited + delay > policy.budget):
+                    logger.error(f'Неудачный запрос, ошибка: {str(e) or repr(e)}. Прекращение повторных запросов.')
+                    if raise_errors:
+                        raise
+                    return
+                waited += delay
+                self.metrics.count(url, 'retries')
+                logger.error(f'Неудачный запрос, ошибка: {str(e) or repr(e)}. Повтор через {delay:.1f} секунд.')
+                await asyncio.sleep(delay)
 
     async def close(self):
-        await self.session.close()
+        if self._session is not None:
+            session, self._session = self._session, None
+            await self.session_registry.release(session)
 
     async def __aenter__(self):
         return self
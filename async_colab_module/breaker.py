@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from async_colab_module.limiter import get_host
+
+logger = logging.getLogger('API')
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(aiohttp.ClientError):
+    """Хост недоступен: запрос отклонен без обращения к API"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f'Хост {host} временно недоступен, следующая проверка через {retry_in:.1f} секунд')
+        self.host = host
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Предохранитель хоста: после failure_threshold ошибок подряд запросы отклоняются сразу,
+    через reset_timeout пропускается пробный запрос, успешный ответ возвращает обычный режим"""
+
+    def __init__(self, host: str = '', failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+    def check(self):
+        """Отклоняет запрос, пока хост признан недоступным (без учета пробных запросов)"""
+        if self.state == OPEN:
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if retry_in > 0:
+                raise CircuitOpenError(self.host, retry_in)
+
+    def before_request(self):
+        """Пропускает запрос или отклоняет его. Для пробного запроса возвращает отметку,
+        которую нужно передать в release_probe после его завершения, иначе None"""
+        if self.state == CLOSED:
+            return None
+        if self.state == OPEN:
+            self.check()
+            self.state, self.probes = HALF_OPEN, 0
+        # Полуоткрытое состояние: пропускаем ограниченное число пробных запросов
+        if self.probes >= self.half_open_max_calls:
+            raise CircuitOpenError(self.host, self.reset_timeout)
+        self.probes += 1
+        return self.opened_at
+
+    def release_probe(self, probe):
+        """Освобождает место пробного запроса, завершившегося без record_success/record_failure
+        (отменен или упал с ошибкой, не считающейся сбоем хоста): следующий запрос станет пробным"""
+        # opened_at меняется при каждом открытии: место из прошлого цикла проверки не освобождаем
+        if probe is not None and self.state == HALF_OPEN and self.opened_at == probe and self.probes > 0:
+            self.probes -= 1
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f'Хост {self.host} снова отвечает, запросы возобновлены')
+        self.state, self.failures, self.probes = CLOSED, 0, 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.error(f'Хост {self.host}: {self.failures} ошибок подряд, '
+                             f'запросы приостановлены на {self.reset_timeout:g} секунд')
+            self.state, self.opened_at = OPEN, time.monotonic()
+
+    @staticmethod
+    def is_failure(error: Exception) -> bool:
+        """Сбоем хоста считаются 5xx, таймауты и обрывы соединения, но не 429 и не ошибки запроса 4xx"""
+        if isinstance(error, CircuitOpenError):
+            return False
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status >= 500
+        return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError, ConnectionError))
+
+
+class CircuitBreakerRegistry:
+    """Отдельный предохранитель на каждый хост"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.breakers = {}
+
+    def get(self, url) -> CircuitBreaker:
+        host = get_host(url)
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout,
+                                                           self.half_open_max_calls)
+        return breaker
@@ -0,0 +1,66 @@
+import numpy as np
+
+from async_colab_module.utils import get_product_id_from_url
+
+
+class BundleStockIndex:
+    """Индекс комплект -> компоненты в массивах (формат CSR) для расчета остатков всех комплектов разом.
+
+    Компоненты комплекта i занимают позиции indptr[i]:indptr[i + 1] в массивах indices (номер товара
+    в product_ids) и quantities (количество в комплекте). Расчет совпадает с get_stock_for_bundle:
+    наибольшее floor(остаток / количество) по компонентам, не меньше 0.
+    """
+
+    def __init__(self, bundles):
+        self.bundles = bundles
+        self.product_ids = []
+        positions = {}
+        indptr = [0]
+        indices = []
+        quantities = []
+        for bundle in bundles:
+            for component in bundle["components"]["rows"]:
+                product_id = get_product_id_from_url(component["assortment"]["meta"]["href"])
+                if product_id is None:
+                    continue
+                position = positions.get(product_id)
+                if position is None:
+                    position = positions[product_id] = len(self.product_ids)
+                    self.product_ids.append(product_id)
+                indices.append(position)
+                quantities.append(component["quantity"])
+            indptr.append(len(indices))
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int32)
+        self.quantities = np.array(quantities, dtype=np.float64)
+        # Для reduceat нужны начала только непустых комплектов
+        lengths = np.diff(self.indptr)
+        self.nonempty = lengths > 0
+        self.starts = self.indptr[:-1][self.nonempty]
+
+    def __len__(self):
+        return len(self.bundles)
+
+    def stock_vector(self, stocks_dict) -> np.ndarray:
+        """Остатки товаров индекса в порядке product_ids, отсутствующие в отчете - 0"""
+        return np.fromiter((stocks_dict.get(product_id, 0.0) for product_id in self.product_ids),
+                           dtype=np.float64, count=len(self.product_ids))
+
+    def compute(self, stocks) -> np.ndarray:
+        """Остатки комплектов в порядке bundles; stocks - словарь {id товара: остаток} или результат stock_vector"""
+        if isinstance(stocks, dict):
+            stocks = self.stock_vector(stocks)
+        result = np.zeros(len(self.bundles), dtype=np.float64)
+        if len(self.starts):
+            # floor_divide для float совпадает с оператором // в Python
+            ratios = np.floor_divide(stocks[self.indices], self.quantities)
+            result[self.nonempty] = np.maximum.reduceat(ratios, self.starts)
+        return np.maximum(result, 0.0)
+
+    def to_dict(self, stocks, key: str = "code") -> dict:
+        """{code: остаток} как в get_ms_stocks_dict или {article: остаток} при key='article'"""
+        if key == "code":
+            keys = (int(bundle["code"]) for bundle in self.bundles)
+        else:
+            keys = (bundle[key] for bundle in self.bundles)
+        return dict(zip(keys, self.compute(stocks).tolist()))
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('API')
+
+
+class ResponseCache:
+    """LRU-кэш ответов API с временем жизни записей и необязательным хранением в SQLite"""
+
+    def __init__(self, max_size: int = 256, path: str = None):
+        self.max_size = max_size
+        # {key: (истекает, url, значение)}
+        self._entries = OrderedDict()
+        self.path = path
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path)
+            self._db.execute('CREATE TABLE IF NOT EXISTS response_cache '
+                             '(key TEXT PRIMARY KEY, url TEXT, expires REAL, value TEXT)')
+            self._db.execute('DELETE FROM response_cache WHERE expires <= ?', (time.time(),))
+            self._db.commit()
+
+    @staticmethod
+    def make_key(method, url, params=None, body=None, identity=None) -> str:
+        # Токен не хранится в ключе в открытом виде, но разделяет данные разных кабинетов
+        identity = hashlib.sha256(str(identity).encode()).hexdigest() if identity else ''
+        if isinstance(params, dict):
+            params = sorted((str(key), str(value)) for key, value in params.items())
+        raw = json.dumps([method, str(url), params, body, identity], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            row = self._db.execute('SELECT expires, url, value FROM response_cache WHERE key = ?',
+                                   (key,)).fetchone()
+            if row:
+                entry = (row[0], row[1], json.loads(row[2]))
+                self._remember(key, entry)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            self._forget(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def set(self, key, url, value, ttl: float):
+        entry = (time.time() + ttl, str(url), value)
+        self._remember(key, entry)
+        if self._db is not None:
+            self._db.execute('INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?)',
+                             (key, entry[1], entry[0], json.dumps(value, ensure_ascii=False)))
+            self._db.commit()
+
+    def invalidate(self, pattern: str = None):
+        """Удаляет записи, url которых содержит pattern, или весь кэш"""
+        if pattern is None:
+            self._entries.clear()
+        else:
+            for key in [key for key, entry in self._entries.items() if pattern in entry[1]]:
+                del self._entries[key]
+        if self._db is not None:
+            if pattern is None:
+                self._db.execute('DELETE FROM response_cache')
+            else:
+                self._db.execute("DELETE FROM response_cache WHERE instr(url, ?) > 0", (pattern,))
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _forget(self, key):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute('DELETE FROM response_cache WHERE key = ?', (key,))
+            self._db.commit()
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger('API')
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS ms_entities '
+    '(entity TEXT, id TEXT, article TEXT, code TEXT, data TEXT, PRIMARY KEY (entity, id))',
+    'CREATE INDEX IF NOT EXISTS ms_entities_article ON ms_entities (article)',
+    'CREATE INDEX IF NOT EXISTS ms_entities_code ON ms_entities (code)',
+    'CREATE TABLE IF NOT EXISTS wb_prices (nm_id INTEGER PRIMARY KEY, vendor_code TEXT, data TEXT)',
+    'CREATE TABLE IF NOT EXISTS ym_offers (business_id INTEGER, offer_id TEXT, data TEXT, '
+    'PRIMARY KEY (business_id, offer_id))',
+    'CREATE INDEX IF NOT EXISTS ym_offers_offer_id ON ym_offers (offer_id)',
+    'CREATE TABLE IF NOT EXISTS wb_orders (srid TEXT PRIMARY KEY, date TEXT, last_change_date TEXT, data TEXT)',
+    'CREATE INDEX IF NOT EXISTS wb_orders_date ON wb_orders (date)',
+    'CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, checkpoint TEXT, updated_at REAL)',
+)
+
+
+class CatalogStore:
+    """Локальное хранилище каталога в SQLite: товары и комплекты Мой склад, цены и заказы WB,
+    предложения ЯндексМаркет.
+
+    Для Мой склад хранилище работает как снимок CatalogSnapshot: get_products_list(snapshot=store)
+    загружает только изменения. После перезапуска данные доступны сразу, обновление можно запустить
+    в фоне через start_refresh.
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+        self.refresh_task = None
+
+    # Снимок Мой склад (интерфейс CatalogSnapshot)
+
+    def get_checkpoint(self, entity: str):
+        return self.get_state(f'ms:{entity}')[0]
+
+    def set_checkpoint(self, entity: str, checkpoint):
+        self.set_state(f'ms:{entity}', checkpoint)
+
+    def rows(self, entity: str) -> list:
+        return [json.loads(data) for data, in
+                self._db.execute('SELECT data FROM ms_entities WHERE entity = ?', (entity,))]
+
+    def ids(self, entity: str) -> set:
+        return {entity_id for entity_id, in self._db.execute('SELECT id FROM ms_entities WHERE entity = ?',
+                                                             (entity,))}
+
+    def count(self, entity: str) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM ms_entities WHERE entity = ?', (entity,)).fetchone()[0]
+
+    def upsert(self, entity: str, rows):
+        self._db.executemany('INSERT OR REPLACE INTO ms_entities VALUES (?, ?, ?, ?, ?)',
+                             ((entity, row['id'], row.get('article'), row.get('code'),
+                               json.dumps(row, ensure_ascii=False)) for row in rows))
+
+    def delete(self, entity: str, ids):
+        self._db.executemany('DELETE FROM ms_entities WHERE entity = ? AND id = ?',
+                             ((entity, entity_id) for entity_id in ids))
+
+    def save(self):
+        self._db.commit()
+
+    # Поиск
+
+    def find_by_article(self, article: str, entity: str = None) -> list:
+        return self._find('article', article, entity)
+
+    def find_by_code(self, code: str, entity: str = None) -> list:
+        return self._find('code', str(code), entity)
+
+    def _find(self, column: str, value: str, entity: str = None) -> list:
+        query = f'SELECT data FROM ms_entities WHERE {column} = ?'
+        params = (value,)
+        if entity:
+            query, params = query + ' AND entity = ?', params + (entity,)
+        return [json.loads(data) for data, in self._db.execute(query, params)]
+
+    # Цены WB
+
+    def set_wb_prices(self, goods: list):
+        """Полная замена списка цен (ответ WB.get_product_prices)"""
+        self._db.execute('DELETE FROM wb_prices')
+        self._db.executemany('INSERT OR REPLACE INTO wb_prices VALUES (?, ?, ?)',
+                             ((item['nmID'], item.get('vendorCode'), json.dumps(item, ensure_ascii=False))
+                              for item in goods))
+        self.set_state('wb:prices')
+        self._db.commit()
+
+    def wb_prices(self) -> list:
+        return [json.loads(data) for data, in self._db.execute('SELECT data FROM wb_prices')]
+
+    def get_wb_price(self, nm_id: int):
+        row = self._db.execute('SELECT data FROM wb_prices WHERE nm_id = ?', (nm_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Предложения ЯндексМаркет
+
+    def set_ym_offers(self, business_id: int, offers: list):
+        """Полная замена предложений кабинета (ответ YM.get_full_offers)"""
+        self._db.execute('DELETE FROM ym_offers WHERE business_id = ?', (business_id,))
+        self._db.executemany('INSERT OR REPLACE INTO ym_offers VALUES (?, ?, ?)',
+                             ((business_id, offer['offer']['offerId'], json.dumps(offer, ensure_ascii=False))
+                              for offer in offers))
+        self.set_state(f'ym:offers:{business_id}')
+        self._db.commit()
+
+    def ym_offers(self, business_id: int) -> list:
+        return [json.loads(data) for data, in
+                self._db.execute('SELECT data FROM ym_offers WHERE business_id = ?', (business_id,))]
+
+    def get_ym_offer(self, offer_id: str, business_id: int = None):
+        query, params = 'SELECT data FROM ym_offers WHERE offer_id = ?', (offer_id,)
+        if business_id is not None:
+            query, params = query + ' AND business_id = ?', params + (business_id,)
+        row = self._db.execute(query, params).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Заказы WB
+
+    def upsert_wb_orders(self, orders: list):
+        self._db.executemany('INSERT OR REPLACE INTO wb_orders VALUES (?, ?, ?, ?)',
+                             ((order['srid'], order['date'], order['lastChangeDate'],
+                               json.dumps(order, ensure_ascii=False)) for order in orders))
+
+    def wb_orders(self, date_from: str = None, date_to: str = None) -> list:
+        """Заказы с датой заказа в [date_from, date_to), даты в формате ISO ('2024-01-01T18:00:00')"""
+        query, params = 'SELECT data FROM wb_orders WHERE 1 = 1', ()
+        if date_from:
+            query, params = query + ' AND date >= ?', params + (date_from,)
+        if date_to:
+            query, params = query + ' AND date < ?', params + (date_to,)
+        return [json.loads(data) for data, in self._db.execute(query + ' ORDER BY date', params)]
+
+    async def sync_wb_orders(self, wb_client, date_from: str):
+        """Догружает заказы WB, измененные после сохраненной отметки lastChangeDate. Если нужен период
+        раньше уже загруженного, загрузка начинается заново с date_from. Отметка сохраняется после
+        каждой страницы, прерванная загрузка продолжается с нее"""
+        cursor = self.get_state('wb:orders')[0]
+        start = self.get_state('wb:orders:start')[0]
+        if cursor is None or start is None or date_from < start:
+            cursor, start = date_from, None
+        async for orders in wb_client.iter_order_changes(cursor):
+            self.upsert_wb_orders(orders)
+            self.set_state('wb:orders', max(order['lastChangeDate'] for order in orders))
+            if start is None:
+                start = date_from
+                self.set_state('wb:orders:start', start)
+            self._db.commit()
+
+    # Состояние синхронизации
+
+    def get_state(self, name: str) -> tuple:
+        """(отметка синхронизации, время последнего обновления) или (None, None)"""
+        row = self._db.execute('SELECT checkpoint, updated_at FROM sync_state WHERE name = ?', (name,)).fetchone()
+        return tuple(row) if row else (None, None)
+
+    def set_state(self, name: str, checkpoint=None):
+        self._db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)', (name, checkpoint, time.time()))
+
+    def age(self, name: str):
+        """Секунд с последнего обновления данных name ('ms:product', 'wb:prices', ...), None - данных нет"""
+        updated_at = self.get_state(name)[1]
+        return time.time() - updated_at if updated_at else None
+
+    # Обновление
+
+    async def refresh(self, ms_client=None, wb_client=None, ym_client=None, business_id: int = None):
+        """Обновляет данные тех площадок, клиенты которых переданы"""
+        tasks = []
+        if ms_client is not None:
+            tasks += [ms_client.get_products_list(snapshot=self), ms_client.get_bundles(snapshot=self)]
+        if wb_client is not None:
+            tasks.append(self._refresh_wb(wb_client))
+        if ym_client is not None and business_id is not None:
+            tasks.append(self._refresh_ym(ym_client, business_id))
+        await asyncio.gather(*tasks)
+
+    async def _refresh_wb(self, wb_client):
+        goods = await wb_client.get_product_prices()
+        # None - список получен не полностью, пустой ответ - скорее ошибка загрузки: прежние цены не затираем
+        if goods:
+            self.set_wb_prices(goods)
+
+    async def _refresh_ym(self, ym_client, business_id: int):
+        offers = await ym_client.get_full_offers(business_id)
+        if offers:
+            self.set_ym_offers(business_id, offers)
+
+    def start_refresh(self, ms_client=None, wb_client=None, ym_client=None, business_id: int = None,
+                      interval: float = None) -> asyncio.Task:
+        """Фоновое обновление; interval - повторять каждые interval секунд, пока задачу не отменят.
+        Клиенты должны оставаться открытыми, пока работает задача"""
+        async def run():
+            while True:
+                try:
+                    await self.refresh(ms_client, wb_client, ym_client, business_id)
+                except Exception as e:
+                    logger.error(f'Ошибка фонового обновления каталога: {str(e) or repr(e)}')
+                if not interval:
+                    return
+                await asyncio.sleep(interval)
+
+        if self.refresh_task is not None and not self.refresh_task.done():
+            return self.refresh_task
+        self.refresh_task = asyncio.ensure_future(run())
+        return self.refresh_task
+
+    def close(self):
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+        self._db.close()
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import logging
+import os
+
+from async_colab_module.json_stream import project_fields
+
+logger = logging.getLogger('MoySklad')
+
+
+class CatalogSnapshot:
+    """Локальная копия сущностей Мой склад ({entity: {id: строка}}) с отметкой последней синхронизации.
+
+    path - JSON-файл, в котором снимок хранится между запусками.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        # {entity: {'checkpoint': 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' | None, 'rows': {id: строка}}}
+        self.entities = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                self.entities = json.load(file)
+
+    def _entity(self, entity: str) -> dict:
+        return self.entities.setdefault(entity, {'checkpoint': None, 'rows': {}})
+
+    def get_checkpoint(self, entity: str):
+        return self._entity(entity)['checkpoint']
+
+    def set_checkpoint(self, entity: str, checkpoint):
+        self._entity(entity)['checkpoint'] = checkpoint
+
+    def rows(self, entity: str) -> list:
+        return list(self._entity(entity)['rows'].values())
+
+    def ids(self, entity: str) -> set:
+        return set(self._entity(entity)['rows'])
+
+    def count(self, entity: str) -> int:
+        return len(self._entity(entity)['rows'])
+
+    def upsert(self, entity: str, rows):
+        self._entity(entity)['rows'].update((row['id'], row) for row in rows)
+
+    def delete(self, entity: str, ids):
+        entity_rows = self._entity(entity)['rows']
+        for entity_id in ids:
+            entity_rows.pop(entity_id, None)
+
+    def save(self):
+        if not self.path:
+            return
+        # Запись через временный файл: прерванное сохранение не портит прежний снимок
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.entities, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def get_checkpoint(rows, checkpoint=None):
+    """Наибольшее значение updated среди строк с точностью до секунды (формат фильтра Мой склад)"""
+    for row in rows:
+        updated = (row.get('updated') or '')[:19]
+        if updated and (checkpoint is None or updated > checkpoint):
+            checkpoint = updated
+    return checkpoint
+
+
+async def sync_entity(ms_client, snapshot, entity: str, url: str, limit: int = 1000):
+    """Обновляет снимок сущности entity: первый раз загружается все, дальше - только строки
+    с updated не раньше отметки, удаленные строки находятся сравнением количества и сканированием id.
+
+    Отметка берется из поля updated полученных строк, то есть по часам сервера. Фильтр updated>=
+    повторно отдает строки с граничной секундой, повторная запись строки ничего не меняет.
+    """
+    checkpoint = snapshot.get_checkpoint(entity)
+    params = {'filter': f'updated>={checkpoint}'} if checkpoint else None
+    ids_url = f'{ms_client.host}entity/{entity}'
+    rows = await ms_client.get_with_pagination(url, limit=limit, params=params)
+    snapshot.upsert(entity, rows)
+    logger.info(f'{entity}: получено изменений {len(rows)}' if checkpoint else f'{entity}: загружено {len(rows)}')
+
+    # Страница, не загрузившаяся после повторов, пропускается с ошибкой в логе - такую выгрузку
+    # повторяем со старой отметкой при следующем запуске
+    expected, size = await asyncio.gather(ms_client.get_size(ids_url, params), ms_client.get_size(ids_url))
+    if expected is None or size is None or len(rows) < expected:
+        logger.error(f'{entity}: изменения получены не полностью, отметка синхронизации не изменена')
+        snapshot.save()
+        return snapshot
+
+    # Новые и измененные строки уже получены, поэтому снимок содержит все строки сервера
+    # и может отличаться только удаленными: хватает сравнения количества
+    if snapshot.count(entity) > size:
+        ids = {row['id'] async for row in ms_client.iter_with_pagination(ids_url, limit=1000,
+                                                                          project=project_fields('id'))}
+        if len(ids) != size:
+            logger.error(f'{entity}: список id получен не полностью, удаленные записи не сверены')
+        else:
+            deleted = snapshot.ids(entity) - ids
+            snapshot.delete(entity, deleted)
+            logger.info(f'{entity}: удалено {len(deleted)}')
+    snapshot.set_checkpoint(entity, get_checkpoint(rows, checkpoint))
+    snapshot.save()
+    return snapshot
@@ -0,0 +1,26 @@
+import json
+
+
+class JsonCodec:
+    """Кодек JSON для тел запросов и ответов: loads принимает bytes/str, dumps возвращает bytes"""
+
+    def __init__(self, loads=None, dumps=None, name: str = 'json'):
+        self.loads = loads or json.loads
+        self.dumps = dumps or self._dumps
+        self.name = name
+
+    @staticmethod
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def get_default_codec() -> JsonCodec:
+    """orjson, если установлен (pip install async_colab_module[fast]), иначе стандартный json"""
+    try:
+        import orjson
+    except ImportError:
+        return JsonCodec()
+    return JsonCodec(loads=orjson.loads, dumps=orjson.dumps, name='orjson')
+
+
+default_codec = get_default_codec()
@@ -11,9 +11,11 @@ from async_colab_module import (
     get_api_tokens,
     MoySklad,
     get_prime_cost,
-    get_stock_for_bundle,
     get_ya_data_,
+    project_bundle,
 )
+from async_colab_module.bundle_stock import BundleStockIndex
+from async_colab_module.catalog_store import CatalogStore
 from async_colab_module.tabstyle import TabStyles
 from async_colab_module.ya_market import (
     YM,
@@ -26,37 +28,39 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("PRICES")
 
 
-async def get_desired_prices(plan_margin: float = 25.0, fbs: bool = True):
-    ms_token, _, ym_token = get_api_tokens()
-    ms_client = MoySklad(api_key=ms_token)
-    products_ = await ms_client.get_bundles()
+async def get_desired_prices_data(ms_client, ym_client, plan_margin: float = 25.0, fbs: bool = True,
+                                  store=None):
+    # С хранилищем каталога загружаются только изменения комплектов с прошлого запуска
+    products_ = await ms_client.get_bundles(project=project_bundle, snapshot=store)
     print(f"Мой склад: {len(products_)}")
     # Оставляем только Яндекс
     ms_ya_products = [
         product for product in products_ if "ЯндексМаркет" in product["pathName"]
     ]
     print("Мой склад: Получение остатка товара")
-    stocks = await ms_client.get_stock()
-    ms_stocks = {stock["assortmentId"]: stock["quantity"] for stock in stocks}
+    ms_stocks = await ms_client.get_stock_dict()
+    stocks = BundleStockIndex(ms_ya_products).compute(ms_stocks).tolist()
     print("Мой склад: Получение себестоимости товара")
     ms_ya_products_ = {
         product["article"]: {
-            "STOCK": get_stock_for_bundle(ms_stocks, product),
+            "STOCK": stock,
             "PRIME_COST": get_prime_cost(product.get("salePrices", [])),
             "NAME": product["name"],
         }
-        for product in ms_ya_products
+        for product, stock in zip(ms_ya_products, stocks)
     }
     logger.info(len(ms_ya_products_))
-    await ms_client.close()
-
-    ym_client = YM(api_key=ym_token, max_rete=45, time_period=3)
 
     campaign_id, business_id = await get_ya_campaign_and_business_ids(
         ym_client, fbs=fbs
     )
 
     offers = await ym_client.get_full_offers(business_id)
+    if store is not None:
+        if offers:
+            store.set_ym_offers(business_id, offers)
+        else:
+            offers = store.ym_offers(business_id)
 
     print("ЯндексМаркет: Получение актуальных тарифов")
     offers_commission_dict = await chunked_offers_list(
@@ -67,8 +71,6 @@ async def get_desired_prices(plan_margin: float = 25.0, fbs: bool = True):
         chunk_size=200,
     )
 
-    await ym_client.close()
-
     ya_set = set(offers_commission_dict)
     ms_set = set(ms_ya_products_)
 
@@ -82,10 +84,26 @@ async def get_desired_prices(plan_margin: float = 25.0, fbs: bool = True):
         print("Номенклатура которая есть в ЯндексМаркете, но не связана в МС:")
         print("\n".join(ya_ms_set))
 
-    data_for_report = [
+    return [
         get_ya_data_(article, result_dict[article], plan_margin)
         for article in result_dict
     ]
+
+
+async def get_desired_prices(plan_margin: float = 25.0, fbs: bool = True, store_path: str = None):
+    ms_token, _, ym_token = get_api_tokens()
+    store = CatalogStore(store_path) if store_path else None
+    try:
+        async with MoySklad(api_key=ms_token) as ms_client, YM(
+            api_key=ym_token, max_rete=45, time_period=3
+        ) as ym_client:
+            data_for_report = await get_desired_prices_data(
+                ms_client, ym_client, plan_margin=plan_margin, fbs=fbs, store=store
+            )
+    finally:
+        # Соединение с базой закрывается и при ошибке выгрузки
+        if store is not None:
+            store.close()
     print('Формирую отчет "Рекомендуемые цены"')
     # progress_bar.update(50)
     pd.set_option("display.max_columns", None)
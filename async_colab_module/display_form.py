@@ -1,12 +1,14 @@
-import time
 import asyncio
 import ipywidgets as widgets
 import pandas as pd
 from IPython.display import display
 from datetime import datetime, timedelta
 
+from async_colab_module.catalog_store import CatalogStore
+from async_colab_module.fbo_report import get_orders_data_fbo
+from async_colab_module.scheduler import INTERACTIVE, request_priority
 from async_colab_module.tabstyle import TabStyles
-from async_colab_module.utils import get_order_data_fbo
+from async_colab_module.utils import get_product_record
 
 
 class ProgressBar(widgets.IntProgress):
@@ -24,15 +26,19 @@ class ProgressBar(widgets.IntProgress):
 
 
 # Функция для запуска отчета
-async def get_report(wb_client, base_dict, nm_ids_dict, from_date, to_date):
+async def get_report(wb_client, base_dict, nm_ids_dict, from_date, to_date, store=None):
     progress_bar = ProgressBar(description='Формирование отчета:', bar_style='success')
     display(progress_bar)
     print(f'Получаем заказы FBO за период: {from_date} - {to_date}')
-    orders = await wb_client.get_orders(from_date)
-    # TODO: Изменить на гейзер
-    if from_date != to_date:
-        time.sleep(20)
-        orders.extend(await wb_client.get_orders(to_date))
+    # Заказы читаются из локальной копии, из API догружаются только изменения с прошлого отчета.
+    # Лимит статистики (1 запрос в минуту) соблюдает ограничитель клиента, не блокируя цикл событий
+    store = store if store is not None else CatalogStore()
+    # Отчет ждет пользователь - его запросы обгоняют фоновые выгрузки того же клиента
+    with request_priority(INTERACTIVE):
+        await store.sync_wb_orders(wb_client, from_date.isoformat(timespec='seconds'))
+    # Время в форме указано с точностью до минуты, последняя минута входит в период
+    orders = store.wb_orders(from_date.isoformat(timespec='seconds'),
+                             (to_date + timedelta(minutes=1)).isoformat(timespec='seconds'))
     progress_bar.update(25)
     orders_ = [order for order in orders if order.get('orderType') == 'Клиентский'
                and not order.get('isCancel')
@@ -41,16 +47,12 @@ async def get_report(wb_client, base_dict, nm_ids_dict, from_date, to_date):
     progress_bar.update(30)
     print(f'Получили заказов FBO за период: {len(orders_)}')
 
-    orders_for_report = [
-        get_order_data_fbo(order, nm_ids_dict[order.get('nmId')], base_dict)
-        for order in orders_
-        if order.get('nmId') in nm_ids_dict
-    ]
-    if orders_for_report:
+    # Метрики всех заказов считаются по столбцам, результат совпадает с построчным get_order_data_fbo
+    df = get_orders_data_fbo(orders_, nm_ids_dict, base_dict)
+    if not df.empty:
         print(f'Формирую отчет по заказам от {from_date} до {to_date}')
         progress_bar.update(50)
         pd.set_option('display.max_columns', None)
-        df = pd.DataFrame(orders_for_report)
         path_xls_file = 'wb_рентабельность_fbo.xlsx'
         # Возможно убрать и не хранить общую таблицу
         df.to_excel(path_xls_file, sheet_name='Список FBO', index=False)
@@ -170,19 +172,23 @@ async def get_report(wb_client, base_dict, nm_ids_dict, from_date, to_date):
     await wb_client.close()
 
 
-def submit_form(wb_client, base_dict, nm_ids_dict, from_input, to_input):
+def submit_form(wb_client, base_dict, nm_ids_dict, from_input, to_input, store=None):
     from_input_value = from_input.value
     to_input_value = to_input.value
     try:
         # Проверяем корректность формата даты и времени
         from_date = datetime.strptime(from_input_value, '%Y-%m-%d %H:%M')
         to_date = datetime.strptime(to_input_value, '%Y-%m-%d %H:%M')
-        asyncio.create_task(get_report(wb_client, base_dict, nm_ids_dict, from_date, to_date))
+        asyncio.create_task(get_report(wb_client, base_dict, nm_ids_dict, from_date, to_date, store=store))
     except ValueError:
         print("Пожалуйста, введите корректную дату и время в формате YYYY-MM-DD HH:MM.")
 
 
-def get_display_form(wb_client, base_dict, nm_ids_dict):
+def get_display_form(wb_client, base_dict, nm_ids_dict, store=None):
+    # Одно хранилище на форму: повторные отчеты догружают только новые изменения заказов
+    store = store if store is not None else CatalogStore()
+    # Товары разбираются один раз на форму, отчеты берут готовые ProductRecord
+    nm_ids_dict = {nm_id: get_product_record(product) for nm_id, product in nm_ids_dict.items()}
     to_date = datetime.now().date()
     # Получаем вчерашний день (from_date)
     from_date = to_date - timedelta(days=1)
@@ -199,7 +205,7 @@ def get_display_form(wb_client, base_dict, nm_ids_dict):
     )
     # Кнопка для обработки значений формы и вызова основной функции
     button = widgets.Button(description="Сформировать отчет", button_style='info')
-    button.on_click(lambda b: submit_form(wb_client, base_dict, nm_ids_dict, from_input, to_input))
+    button.on_click(lambda b: submit_form(wb_client, base_dict, nm_ids_dict, from_input, to_input, store=store))
 
     # Отображаем элементы виджета
     display(from_input)
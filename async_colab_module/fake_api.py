@@ -0,0 +1,442 @@
+"""Локальный стенд API Мой склад, WB и ЯндексМаркет для тестов и замеров производительности без сети.
+
+Использование:
+
+    async with FakeApiServer(FakeCatalog(products=1000), latency=0.01) as server:
+        ms_client = MoySklad(api_key='token')
+        server.attach(ms_client)
+        bundles = await ms_client.get_bundles()
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+MS_HOST = 'https://api.moysklad.ru/api/remap/1.2/'
+
+# Хосты API и префиксы путей на стенде
+PREFIXES = {
+    'https://api.moysklad.ru': '/ms',
+    'https://suppliers-api.wildberries.ru': '/wb-suppliers',
+    'https://common-api.wildberries.ru': '/wb-common',
+    'https://discounts-prices-api.wb.ru': '/wb-prices',
+    'https://statistics-api.wildberries.ru': '/wb-statistics',
+    'https://api.partner.market.yandex.ru': '/ym',
+}
+
+WAREHOUSES = ('Коледино', 'Подольск', 'Казань', 'Электросталь', 'Маркетплейс')
+CATEGORIES = ('Наборы инструментов', 'Посуда', 'Игрушки', 'Текстиль', 'Канцелярия')
+
+
+def _ms_datetime(value: datetime) -> str:
+    return value.strftime('%Y-%m-%d %H:%M:%S.000')
+
+
+class FakeCatalog:
+    """Синтетический каталог: товары и комплекты Мой склад, цены и заказы WB, предложения ЯндексМаркет"""
+
+    def __init__(self, products: int = 100, bundles: int = None, orders: int = 0, fbs_orders: int = 0,
+                 seed: int = 0, start: datetime = None):
+        rnd = random.Random(seed)
+        self.start = start or datetime(2024, 1, 1)
+        bundles = products if bundles is None else bundles
+
+        self.products = []
+        for i in range(products):
+            product_id = str(uuid.UUID(int=rnd.getrandbits(128)))
+            self.products.append({
+                'meta': {'href': f'{MS_HOST}entity/product/{product_id}', 'type': 'product'},
+                'id': product_id,
+                'updated': _ms_datetime(self.start),
+                'name': f'Товар {i}',
+                'code': str(100000 + i),
+                'article': f'P-{i}',
+                'pathName': 'Товары',
+                'salePrices': [{'value': rnd.randint(100, 5000) * 100.0, 'priceType': {'name': 'Цена основная'}}],
+            })
+        self.products_by_id = {product['id']: product for product in self.products}
+        self.stock = [{'assortmentId': product['id'], 'quantity': float(rnd.randint(0, 50))}
+                      for product in self.products]
+
+        self.bundles = []
+        self.wb_goods = []
+        for i in range(bundles):
+            bundle_id = str(uuid.UUID(int=rnd.getrandbits(128)))
+            nm_id = 10000000 + i
+            components = rnd.sample(self.products, min(len(self.products), rnd.randint(1, 3)))
+            cost = sum(component['salePrices'][0]['value'] for component in components)
+            price_before = round(cost * rnd.uniform(2.0, 3.0), -2)
+            discount = rnd.choice((0, 10, 20, 30, 50))
+            price_after = price_before * (100 - discount) / 100
+            self.bundles.append({
+                'meta': {'href': f'{MS_HOST}entity/bundle/{bundle_id}', 'type': 'bundle'},
+                'id': bundle_id,
+                'updated': _ms_datetime(self.start),
+                'name': f'Комплект {i}',
+                'code': str(nm_id),
+                'article': f'B-{i}',
+                'pathName': 'ЯндексМаркет' if i % 2 else 'WB',
+                'salePrices': [
+                    {'value': cost, 'priceType': {'name': 'Цена основная'}},
+                    {'value': price_after, 'priceType': {'name': 'Цена продажи'}},
+                    {'value': price_before, 'priceType': {'name': 'Цена WB до скидки'}},
+                    {'value': price_after, 'priceType': {'name': 'Цена WB после скидки'}},
+                ],
+                'attributes': [
+                    {'name': 'Длина', 'value': rnd.randint(5, 60)},
+                    {'name': 'Ширина', 'value': rnd.randint(5, 40)},
+                    {'name': 'Высота', 'value': rnd.randint(1, 30)},
+                    {'name': 'Категория товара', 'value': rnd.choice(CATEGORIES)},
+                ],
+                'components': {
+                    'meta': {'href': f'{MS_HOST}entity/bundle/{bundle_id}/components', 'size': len(components)},
+                    'rows': [{'quantity': float(rnd.randint(1, 3)), 'assortment': {'meta': dict(component['meta'])}}
+                             for component in components],
+                },
+            })
+            sizes = [('0', 0)] if i % 5 else [('S', 1), ('M', 2), ('L', 3)]
+            self.wb_goods.append({
+                'nmID': nm_id,
+                'vendorCode': f'B-{i}',
+                'discount': discount,
+                'sizes': [{'sizeID': nm_id * 10 + offset, 'techSize': tech_size, 'price': price_before / 100,
+                           'discountedPrice': price_after / 100 + offset * 10}
+                          for tech_size, offset in sizes],
+            })
+
+        self.commission = {'report': [{'subjectName': category, 'kgvpMarketplace': 15.0 + n,
+                                       'paidStorageKgvp': 20.0 + n} for n, category in enumerate(CATEGORIES)]}
+        self.tariffs_box = {'response': {'data': {'warehouseList': [
+            {'warehouseName': name, 'boxDeliveryBase': f'{30 + n * 5},5', 'boxDeliveryLiter': f'{5 + n},0',
+             'boxDeliveryAndStorageExpr': str(100 + n * 25)} for n, name in enumerate(WAREHOUSES)]}}}
+
+        self.orders = []
+        for i in range(orders if self.wb_goods else 0):
+            goods = rnd.choice(self.wb_goods)
+            size = rnd.choice(goods['sizes'])
+            bundle = self.bundles[goods['nmID'] - 10000000]
+            created = self.start + timedelta(minutes=rnd.randint(0, 60 * 24 * 30))
+            self.orders.append({
+                'date': created.isoformat(),
+                'lastChangeDate': (created + timedelta(minutes=rnd.randint(0, 120))).isoformat(),
+                'nmId': goods['nmID'],
+                'techSize': size['techSize'],
+                'supplierArticle': goods['vendorCode'],
+                'subject': bundle['attributes'][3]['value'],
+                'warehouseName': rnd.choice(WAREHOUSES + ('Неизвестный склад',)),
+                'finishedPrice': round(size['discountedPrice'] * rnd.uniform(0.8, 1.0), 2),
+                'orderType': 'Клиентский',
+                'isCancel': rnd.random() < 0.05,
+                'sticker': '0',
+                'srid': f'srid-{i}',
+            })
+        self.orders.sort(key=lambda order: order['lastChangeDate'])
+
+        self.fbs_orders = []
+        for i in range(fbs_orders if self.wb_goods else 0):
+            goods = rnd.choice(self.wb_goods)
+            created = self.start + timedelta(minutes=rnd.randint(0, 60 * 24 * 30))
+            self.fbs_orders.append({'id': 1000 + i, 'rid': f'rid-{i}', 'nmId': goods['nmID'],
+                                    'createdAt': created.isoformat() + 'Z',
+                                    'price': int(goods['sizes'][0]['discountedPrice'] * 100)})
+
+        self.ym_offers = [{
+            'offer': {
+                'offerId': bundle['article'],
+                'basicPrice': {'value': bundle['salePrices'][1]['value'] / 100, 'currencyId': 'RUR'},
+                'weightDimensions': {'length': bundle['attributes'][0]['value'],
+                                     'width': bundle['attributes'][1]['value'],
+                                     'height': bundle['attributes'][2]['value'], 'weight': 1.0},
+            },
+            'mapping': {'marketCategoryId': 90000 + n % 7},
+        } for n, bundle in enumerate(self.bundles) if bundle['pathName'] == 'ЯндексМаркет']
+
+    def expand_bundle(self, bundle, expand: str):
+        if 'components' not in expand:
+            return {**bundle, 'components': {'meta': bundle['components']['meta']}}
+        if 'components.rows.assortment' not in expand:
+            return bundle
+        rows = [{**row, 'assortment': self.products_by_id[row['assortment']['meta']['href'].rsplit('/', 1)[1]]}
+                for row in bundle['components']['rows']]
+        return {**bundle, 'components': {**bundle['components'], 'rows': rows}}
+
+
+class FakeApiServer:
+    """aiohttp-сервер, отвечающий как API Мой склад, WB и ЯндексМаркет по данным FakeCatalog.
+
+    latency - задержка ответа, секунд; rate_limit - (запросов, секунд) на хост, сверх лимита ответ 429;
+    error_rate - доля ответов 502; max_page_size - ограничение limit при пагинации.
+    """
+
+    def __init__(self, catalog: FakeCatalog = None, latency: float = 0.0, rate_limit: tuple = None,
+                 error_rate: float = 0.0, max_page_size: int = 1000, seed: int = 0):
+        self.catalog = catalog or FakeCatalog()
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.max_page_size = max_page_size
+        # Строк в одном ответе statistics-api /supplier/orders
+        self.orders_page_size = 80000
+        # Задачи загрузки цен WB: {id: {'created', 'goods'}}, обрабатываются через price_task_delay секунд
+        self.price_tasks = {}
+        self.price_task_delay = 0.05
+        self.random = random.Random(seed)
+        self.request_counts = Counter()
+        self.bytes_sent = 0
+        # Записанные ответы: {(метод, путь): (статус, тело)}, имеют приоритет над синтетическими
+        self.responses = {}
+        self._windows = {}
+        self._runner = None
+        self.base_url = None
+
+    @property
+    def url_map(self) -> dict:
+        return {origin: self.base_url + prefix for origin, prefix in PREFIXES.items()}
+
+    def attach(self, *clients):
+        for client in clients:
+            client.url_map.update(self.url_map)
+
+    def add_response(self, method: str, path: str, payload, status: int = 200):
+        """Ответ для пути стенда, например add_response('GET', '/ms/api/remap/1.2/entity/product', {...})"""
+        self.responses[(method.upper(), path)] = (status, payload)
+
+    def load_recordings(self, path: str):
+        """Загружает записанные ответы из JSON-файла вида {"GET /ms/...": тело ответа}"""
+        with open(path, encoding='utf-8') as file:
+            for key, payload in json.load(file).items():
+                method, route = key.split(' ', 1)
+                self.add_response(method, route, payload)
+
+    async def start(self) -> str:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_route('*', '/{tail:.*}', self._dispatch)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f'http://{host}:{port}'
+        return self.base_url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _is_limited(self, prefix) -> float:
+        """Возвращает паузу до освобождения лимита или 0"""
+        if not self.rate_limit:
+            return 0.0
+        max_requests, period = self.rate_limit
+        window = self._windows.setdefault(prefix, deque())
+        now = time.monotonic()
+        while window and window[0] <= now - period:
+            window.popleft()
+        if len(window) >= max_requests:
+            return window[0] + period - now
+        window.append(now)
+        return 0.0
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        prefix = '/' + request.path.split('/')[1]
+        self.request_counts[(request.method, request.path)] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        retry_after = self._is_limited(prefix)
+        if retry_after:
+            return web.json_response({'errors': [{'error': 'Too Many Requests'}]}, status=429, headers={
+                'Retry-After': f'{retry_after:.3f}', 'X-Ratelimit-Retry': f'{retry_after:.3f}',
+                'X-Ratelimit-Remaining': '0'})
+        if self.error_rate and self.random.random() < self.error_rate:
+            return web.json_response({'errors': [{'error': 'Bad Gateway'}]}, status=502)
+        response = await handler(request)
+        self.bytes_sent += response.content_length or 0
+        return response
+
+    async def _dispatch(self, request):
+        recorded = self.responses.get((request.method, request.path))
+        if recorded:
+            return web.json_response(recorded[1], status=recorded[0])
+        handler = ROUTES.get((request.method, request.path))
+        if handler is None:
+            for (method, pattern), route_handler in ROUTES.items():
+                if method == request.method and pattern.endswith('*') and request.path.startswith(pattern[:-1]):
+                    handler = route_handler
+                    break
+        if handler is None:
+            return web.json_response({'errors': [{'error': f'Нет обработчика {request.path}'}]}, status=404)
+        body = await request.json() if request.can_read_body else None
+        status, payload = handler(self, request.query, body, request.path)
+        return web.json_response(payload, status=status, dumps=lambda obj: json.dumps(obj, ensure_ascii=False))
+
+    def page(self, query, default_limit=1000):
+        limit = min(int(query.get('limit', default_limit)), self.max_page_size)
+        return limit, int(query.get('offset', 0))
+
+    # Мой склад
+
+    @staticmethod
+    def ms_filter(query, rows):
+        """Фильтр вида filter=updated>=2024-01-01 00:00:00;updated<=... (поддерживаются только даты)"""
+        for condition in filter(None, query.get('filter', '').split(';')):
+            for operator, compare in (('>=', str.__ge__), ('<=', str.__le__), ('>', str.__gt__), ('<', str.__lt__)):
+                if operator in condition:
+                    field, value = condition.split(operator, 1)
+                    # Даты в строках хранятся с миллисекундами, в фильтре их может не быть
+                    value = value.ljust(23, '0') if len(value) > 19 else value + '.000'
+                    rows = [row for row in rows if compare(row[field], value)]
+                    break
+        return rows
+
+    def ms_products(self, query, body, path):
+        limit, offset = self.page(query)
+        rows = self.ms_filter(query, self.catalog.products)
+        return 200, {'meta': {'size': len(rows), 'limit': limit, 'offset': offset}, 'rows': rows[offset: offset + limit]}
+
+    def ms_bundles(self, query, body, path):
+        limit, offset = self.page(query)
+        expand = query.get('expand', '')
+        if expand and limit > 100:
+            return 412, {'errors': [{'error': 'При использовании expand limit не может быть больше 100'}]}
+        rows = self.ms_filter(query, self.catalog.bundles)
+        return 200, {'meta': {'size': len(rows), 'limit': limit, 'offset': offset},
+                     'rows': [self.catalog.expand_bundle(bundle, expand) for bundle in rows[offset: offset + limit]]}
+
+    def ms_stock(self, query, body, path):
+        return 200, self.catalog.stock
+
+    # WB
+
+    def wb_commission(self, query, body, path):
+        return 200, self.catalog.commission
+
+    def wb_tariffs_box(self, query, body, path):
+        return 200, self.catalog.tariffs_box
+
+    def wb_goods(self, query, body, path):
+        limit, offset = self.page(query)
+        return 200, {'data': {'listGoods': self.catalog.wb_goods[offset: offset + limit]}}
+
+    def wb_orders(self, query, body, path):
+        date_from = query.get('dateFrom', '')
+        if query.get('flag') == '1':
+            day = date_from[:10]
+            return 200, [order for order in self.catalog.orders if order['date'][:10] == day]
+        orders = [order for order in self.catalog.orders if order['lastChangeDate'] >= date_from]
+        return 200, orders[:self.orders_page_size]
+
+    def wb_upload_prices(self, query, body, path):
+        items = (body or {}).get('data') or []
+        if not items or len(items) > 1000:
+            return 400, {'data': None, 'error': True, 'errorText': 'В запросе должно быть от 1 до 1000 товаров'}
+        goods_by_id = {goods['nmID']: goods for goods in self.catalog.wb_goods}
+        task_id = len(self.price_tasks) + 1
+        history = []
+        for item in items:
+            goods = goods_by_id.get(item.get('nmID'))
+            price, discount = item.get('price', 0), item.get('discount', 0)
+            error = ('Товар не найден' if goods is None else
+                     'Цена должна быть больше 0' if price <= 0 else
+                     'Скидка должна быть от 0 до 99' if not 0 <= discount <= 99 else '')
+            if not error:
+                goods['discount'] = discount
+                for size in goods['sizes']:
+                    size['price'], size['discountedPrice'] = price, price * (100 - discount) / 100
+            history.append({'nmID': item.get('nmID'), 'price': price, 'discount': discount, 'errorText': error})
+        self.price_tasks[task_id] = {'created': time.monotonic(), 'goods': history}
+        return 200, {'data': {'id': task_id, 'alreadyExists': False}, 'error': False, 'errorText': ''}
+
+    def _price_task(self, query):
+        task = self.price_tasks.get(int(query.get('uploadID', 0)))
+        if task is None or time.monotonic() - task['created'] < self.price_task_delay:
+            # Задача еще в обработке - в истории ее нет
+            return None
+        return task
+
+    def wb_price_task_history(self, query, body, path):
+        task = self._price_task(query)
+        if task is None:
+            return 200, {'data': None, 'error': False, 'errorText': ''}
+        errors = sum(1 for goods in task['goods'] if goods['errorText'])
+        status = 3 if not errors else 6 if errors == len(task['goods']) else 5
+        return 200, {'data': {'uploadID': int(query['uploadID']), 'status': status}, 'error': False, 'errorText': ''}
+
+    def wb_price_task_goods(self, query, body, path):
+        task = self._price_task(query)
+        if task is None:
+            return 200, {'data': None, 'error': False, 'errorText': ''}
+        limit, offset = self.page(query)
+        return 200, {'data': {'uploadID': int(query['uploadID']), 'historyGoods': task['goods'][offset: offset + limit]},
+                     'error': False, 'errorText': ''}
+
+    def wb_orders_fbs(self, query, body, path):
+        limit = min(int(query.get('limit', 1000)), self.max_page_size)
+        cursor = int(query.get('next', 0))
+        date_from = int(query.get('dateFrom', 0))
+        date_to = int(query.get('dateTo', 2 ** 40))
+        orders = [order for order in self.catalog.fbs_orders
+                  if order['id'] > cursor
+                  and date_from <= datetime.fromisoformat(order['createdAt'][:-1]).timestamp() <= date_to]
+        orders = orders[:limit]
+        return 200, {'next': orders[-1]['id'] if orders else cursor, 'orders': orders}
+
+    # ЯндексМаркет
+
+    def ym_campaigns(self, query, body, path):
+        return 200, {'campaigns': [{'id': 1, 'business': {'id': 2}}]}
+
+    def ym_offer_mappings(self, query, body, path):
+        limit = int(query.get('limit', 200))
+        offset = int(query.get('page_token') or 0)
+        offers = self.catalog.ym_offers[offset: offset + limit]
+        paging = {'nextPageToken': str(offset + limit)} if offset + limit < len(self.catalog.ym_offers) else {}
+        return 200, {'status': 'OK', 'result': {'paging': paging, 'offerMappings': offers}}
+
+    def ym_tariffs(self, query, body, path):
+        offers = (body or {}).get('offers', [])
+        result = []
+        for offer in offers:
+            price = offer.get('price', 0.0)
+            result.append({'offer': offer, 'tariffs': [
+                {'type': 'FEE', 'amount': round(price * 0.05, 2), 'parameters': [{'name': 'value', 'value': '5.0'}]},
+                {'type': 'PAYMENT_TRANSFER', 'amount': round(price * 0.015, 2),
+                 'parameters': [{'name': 'value', 'value': '1.5'}]},
+                {'type': 'DELIVERY_TO_CUSTOMER', 'amount': round(min(price * 0.05, 500), 2),
+                 'parameters': [{'name': 'value', 'value': '5.0'}, {'name': 'maxValue', 'value': '500'}]},
+                {'type': 'SORTING', 'amount': 45.0,
+                 'parameters': [{'name': 'transitWarehouseType', 'value': 'MINI_SORTING_CENTER'}]},
+                {'type': 'AGENCY_COMMISSION', 'amount': round(price * 0.01, 2), 'parameters': []},
+            ]})
+        return 200, {'status': 'OK', 'result': {'offers': result}}
+
+
+ROUTES = {
+    ('GET', '/ms/api/remap/1.2/entity/product'): FakeApiServer.ms_products,
+    ('GET', '/ms/api/remap/1.2/entity/bundle'): FakeApiServer.ms_bundles,
+    ('GET', '/ms/api/remap/1.2/report/stock/all/current'): FakeApiServer.ms_stock,
+    ('GET', '/wb-common/api/v1/tariffs/commission'): FakeApiServer.wb_commission,
+    ('GET', '/wb-common/api/v1/tariffs/box'): FakeApiServer.wb_tariffs_box,
+    ('GET', '/wb-prices/api/v2/list/goods/filter'): FakeApiServer.wb_goods,
+    ('POST', '/wb-prices/api/v2/upload/task'): FakeApiServer.wb_upload_prices,
+    ('GET', '/wb-prices/api/v2/history/tasks'): FakeApiServer.wb_price_task_history,
+    ('GET', '/wb-prices/api/v2/history/goods/task'): FakeApiServer.wb_price_task_goods,
+    ('GET', '/wb-statistics/api/v1/supplier/orders'): FakeApiServer.wb_orders,
+    ('GET', '/wb-suppliers/api/v3/orders'): FakeApiServer.wb_orders_fbs,
+    ('GET', '/ym/campaigns'): FakeApiServer.ym_campaigns,
+    ('POST', '/ym/businesses/*'): FakeApiServer.ym_offer_mappings,
+    ('POST', '/ym/tariffs/calculate'): FakeApiServer.ym_tariffs,
+}
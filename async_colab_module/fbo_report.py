@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+from async_colab_module.utils import get_price_and_discount, get_product_record, get_tariff_index, get_wb_price
+
+REPORT_COLUMNS = [
+    "name", "nm_id", "article", "stock", "order_create", "order_name", "quantity", "discount",
+    "item_price", "order_price", "cost_price", "commission", "acquiring", "logistics", "reward",
+    "profit", "profitability", "order_reward", "order_profit", "order_profitability",
+]
+ORDER_FIELDS = ["nmId", "techSize", "warehouseName", "finishedPrice", "subject", "date", "sticker"]
+
+
+def round_like_python(values, ndigits: int) -> np.ndarray:
+    """np.round, совпадающий с round() Python: значения у самой границы округления (где умножение
+    на 10**ndigits в np.round могло сдвинуть результат) пересчитываются round()"""
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values, ndigits)
+    scaled = values * 10.0 ** ndigits
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    if near_half.any():
+        rounded[near_half] = [round(value, ndigits) for value in values[near_half].tolist()]
+    return rounded
+
+
+def get_orders_data_fbo(orders, nm_ids_dict, base_dict, acquiring=1.5) -> pd.DataFrame:
+    """Расчет get_order_data_fbo для всех заказов разом: справочные данные считаются один раз
+    на товар, размер, склад и категорию, метрики - операциями над столбцами.
+    Результат совпадает с pd.DataFrame([get_order_data_fbo(...) для каждого заказа]).
+    nm_ids_dict - {nmID: товар Мой склад} или {nmID: ProductRecord} из create_record_index"""
+    orders = [order for order in orders if order.get("nmId", "") in nm_ids_dict]
+    if not orders:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    frame = pd.DataFrame.from_records(orders, columns=ORDER_FIELDS)
+
+    # Товары: цены Мой склад, объем, категория - один раз на nmID
+    nm_codes, nm_ids = pd.factorize(frame["nmId"])
+    records = [get_product_record(nm_ids_dict[nm_id]) for nm_id in nm_ids]
+    cost_price = np.array([record.cost_price for record in records], dtype=np.float64)[nm_codes]
+    volume = np.array([record.volume for record in records], dtype=np.float64)[nm_codes]
+
+    # Цена и скидка WB - один раз на пару (nmID, размер)
+    wb_prices_dict = base_dict["wb_prices_dict"]
+    tech_sizes = frame["techSize"].astype(object).where(frame["techSize"].notna(), None)
+    size_codes, size_keys = pd.factorize(pd.Series(list(zip(nm_codes.tolist(), tech_sizes.tolist()))))
+    size_prices = [
+        get_price_and_discount(get_wb_price(wb_prices_dict, nm_ids[nm_code], tech_size),
+                               records[nm_code].prices_dict)
+        for nm_code, tech_size in size_keys
+    ]
+    price = np.array([price for price, _ in size_prices], dtype=np.float64)[size_codes]
+    discount = np.array([discount for _, discount in size_prices], dtype=object)[size_codes]
+
+    # Логистика - коэффициенты один раз на склад
+    tariff_index = get_tariff_index(base_dict)
+    warehouse_codes, warehouses = pd.factorize(frame["warehouseName"].fillna("Коледино"))
+    tariffs = [tariff_index[warehouse] for warehouse in warehouses]
+
+    def tariff_column(name):
+        return np.array([tariff[name] for tariff in tariffs], dtype=np.float64)[warehouse_codes]
+
+    volume_calc = np.maximum(volume - tariff_column("TARIFF_BASE"), 0)
+    logistics = round_like_python(
+        (tariff_column("TARIFF_FOR_BASE_L") * tariff_column("TARIFF_BASE")
+         + tariff_column("TARIFF_OVER_BASE") * volume_calc)
+        * tariff_column("WH_COEFFICIENT")
+        * tariff_column("KTR"),
+        2,
+    )
+
+    # Комиссия - по категории заказа, если ее нет - по категории товара
+    product_categories = np.array([record.category for record in records], dtype=object)[nm_codes]
+    categories = frame["subject"].astype(object).where(frame["subject"].notna(), product_categories)
+    category_codes, category_names = pd.factorize(categories, use_na_sentinel=False)
+    category_dict = base_dict.get("category_dict", {})
+    commission = np.array([category_dict.get(category, 30) for category in category_names],
+                          dtype=np.float64)[category_codes]
+
+    order_price = round_like_python(frame["finishedPrice"].fillna(0.0).to_numpy(dtype=np.float64), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        commission_cost = round_like_python(commission / 100 * price, 1)
+        acquiring_cost = round_like_python(acquiring / 100 * price, 1)
+        reward = round_like_python(commission_cost + acquiring_cost + logistics, 1)
+        profit = round_like_python(price - cost_price - reward, 1)
+        profitability = round_like_python(profit / price * 100, 1)
+
+        order_commission_cost = round_like_python(commission / 100 * order_price, 1)
+        order_acquiring_cost = round_like_python(acquiring / 100 * order_price, 1)
+        order_reward = round_like_python(order_commission_cost + order_acquiring_cost + logistics, 1)
+        order_profit = round_like_python(order_price - cost_price - order_reward, 1)
+        order_profitability = round_like_python(order_profit / order_price * 100, 1)
+
+    stocks_dict = base_dict.get("ms_stocks_dict", {})
+    return pd.DataFrame({
+        "name": np.array([record.name for record in records], dtype=object)[nm_codes],
+        "nm_id": frame["nmId"],
+        "article": np.array([record.article for record in records], dtype=object)[nm_codes],
+        "stock": pd.Series([stocks_dict.get(nm_id, 0) for nm_id in nm_ids]).to_numpy()[nm_codes],
+        "order_create": frame["date"].fillna(""),
+        "order_name": frame["sticker"].fillna("0"),
+        "quantity": 1,
+        "discount": pd.Series(discount).infer_objects(),
+        "item_price": price,
+        "order_price": order_price,
+        "cost_price": cost_price,
+        "commission": commission_cost,
+        "acquiring": acquiring_cost,
+        "logistics": logistics,
+        "reward": reward,
+        "profit": profit,
+        "profitability": profitability,
+        "order_reward": order_reward,
+        "order_profit": order_profit,
+        "order_profitability": order_profitability,
+    }, columns=REPORT_COLUMNS)
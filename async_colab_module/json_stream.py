@@ -0,0 +1,135 @@
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Символы, которыми может продолжаться число: "12." или "1.5e" на границе чанка - еще не конец числа
+_NUMBER_CHARS = frozenset('0123456789+-.eE')
+
+
+class JsonArrayStream:
+    """Инкрементальный разбор JSON-массива: элементы отдаются по мере поступления данных.
+
+    key=None - массив на верхнем уровне ответа (report/stock/all/current),
+    key='rows' - массив в поле верхнего уровня объекта (страницы entity/*).
+    """
+
+    def __init__(self, key: str = None):
+        self.key = key
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.state = 'start'
+        self.done = False
+
+    def feed(self, chunk) -> list:
+        if isinstance(chunk, bytes):
+            chunk = self.text_decoder.decode(chunk)
+        if self.done:
+            return []
+        self.buffer += chunk
+        items = []
+        pos = self._parse(items, final=False)
+        # Разобранная часть буфера больше не нужна
+        self.buffer = self.buffer[pos:]
+        return items
+
+    def close(self) -> list:
+        self.buffer += self.text_decoder.decode(b'', final=True)
+        items = []
+        if not self.done:
+            pos = self._parse(items, final=True)
+            self.buffer = self.buffer[pos:]
+        if not self.done:
+            raise ValueError(f'Неполный JSON в ответе (состояние разбора: {self.state})')
+        return items
+
+    def _skip(self, pos):
+        return _WHITESPACE.match(self.buffer, pos).end()
+
+    def _decode(self, pos, final):
+        """Разбирает значение с позиции pos, None - если данных пока недостаточно"""
+        try:
+            value, end = self.decoder.raw_decode(self.buffer, pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return None
+        if final:
+            return value, end
+        # Число на границе чанка могло быть обрезано: raw_decode отдает начало "12." или "1.5e"
+        # как целое число. Ждем символ после значения, который не может продолжать число
+        if end >= len(self.buffer):
+            return None
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and self.buffer[end] in _NUMBER_CHARS:
+            return None
+        return value, end
+
+    def _expect(self, pos, char):
+        pos = self._skip(pos)
+        if pos >= len(self.buffer):
+            return None
+        if self.buffer[pos] != char:
+            raise ValueError(f'Ожидался символ {char!r} в позиции {pos}, получен {self.buffer[pos]!r}')
+        return pos + 1
+
+    def _parse(self, items, final):
+        pos = 0
+        buffer = self.buffer
+        while not self.done:
+            if self.state == 'start':
+                start = self._expect(pos, '[' if self.key is None else '{')
+                if start is None:
+                    return pos
+                pos, self.state = start, 'items' if self.key is None else 'key'
+
+            elif self.state == 'key':
+                pos = self._skip(pos)
+                if pos < len(buffer) and buffer[pos] == ',':
+                    pos = self._skip(pos + 1)
+                if pos < len(buffer) and buffer[pos] == '}':
+                    # Поля с массивом в ответе нет
+                    self.done = True
+                    return pos + 1
+                decoded = self._decode(pos, final)
+                if decoded is None:
+                    return pos
+                name, end = decoded
+                value_start = self._expect(end, ':')
+                if value_start is None:
+                    return pos
+                if name == self.key:
+                    array_start = self._expect(value_start, '[')
+                    if array_start is None:
+                        return pos
+                    pos, self.state = array_start, 'items'
+                    continue
+                decoded = self._decode(self._skip(value_start), final)
+                if decoded is None:
+                    return pos
+                # Остальные поля (meta, context) пропускаем
+                pos = decoded[1]
+
+            elif self.state == 'items':
+                pos = self._skip(pos)
+                if pos < len(buffer) and buffer[pos] == ',':
+                    pos = self._skip(pos + 1)
+                if pos >= len(buffer):
+                    return pos
+                if buffer[pos] == ']':
+                    # Массив закончился, остаток ответа не нужен
+                    self.done = True
+                    return pos + 1
+                decoded = self._decode(pos, final)
+                if decoded is None:
+                    return pos
+                item, pos = decoded
+                items.append(item)
+        return pos
+
+
+def project_fields(*fields):
+    """Проекция записи на перечисленные поля"""
+    def project(item):
+        return {field: item.get(field) for field in fields}
+    return project
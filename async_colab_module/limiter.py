@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from aiolimiter import AsyncLimiter
+
+from async_colab_module.scheduler import PrioritySemaphore
+
+logger = logging.getLogger('API')
+
+# Заголовки с паузой после 429: (имя, множитель в секунды)
+RETRY_HEADERS = (
+    ('retry-after', 1),
+    ('x-ratelimit-retry', 1),  # WB
+    ('x-lognex-retry-after', 0.001),  # Мой склад, миллисекунды
+)
+# Заголовки с лимитом запросов на период
+LIMIT_HEADERS = ('x-ratelimit-limit', 'x-ratelimit-resource-limit')
+# Заголовки с остатком запросов в текущем периоде
+REMAINING_HEADERS = ('x-ratelimit-remaining', 'x-ratelimit-resource-remaining')
+# Заголовки со временем до восстановления квоты: (имя, множитель в секунды)
+RESET_HEADERS = (
+    ('x-ratelimit-reset', 1),  # WB
+    ('x-lognex-reset', 0.001),  # Мой склад, миллисекунды
+)
+
+
+def get_host(url: str) -> str:
+    return urlsplit(str(url)).netloc
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_retry_after(value):
+    """Возвращает паузу в секундах из значения Retry-After (секунды или HTTP-дата)"""
+    if value is None:
+        return None
+    seconds = _to_float(value)
+    if seconds is not None:
+        return max(seconds, 0.0)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def get_retry_after(headers):
+    if not headers:
+        return None
+    headers = {key.lower(): value for key, value in headers.items()}
+    for name, scale in RETRY_HEADERS:
+        if name in headers:
+            delay = parse_retry_after(headers[name]) if scale == 1 else _to_float(headers[name])
+            if delay is not None:
+                return delay * scale
+    return None
+
+
+class HostRateLimiter:
+    """Ограничитель частоты запросов к одному хосту, подстраивающийся под заголовки ответов API"""
+
+    def __init__(self, max_rate: float, time_period: float, min_rate: float = 1.0,
+                 low_remaining: int = 1, recovery_step: float = 1.0):
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self.min_rate = min(min_rate, max_rate)
+        # Остаток квоты, при котором ждем восстановления лимита
+        self.low_remaining = low_remaining
+        # Шаг восстановления частоты после успешных ответов
+        self.recovery_step = recovery_step
+        self.rate = max_rate
+        self.limiter = AsyncLimiter(max_rate, time_period)
+        self.paused_until = 0.0
+        # AsyncLimiter выдает токены в порядке очереди. Токен ждет один запрос, остальные стоят
+        # в очереди по приоритету (scheduler.request_priority): интерактивный запрос получает
+        # следующий токен, даже если перед ним в очереди фоновая выгрузка
+        self.gate = PrioritySemaphore(1)
+
+    async def __aenter__(self):
+        async with self.gate:
+            await self.wait_pause()
+            # Ведро рассчитано на потолок max_rate, сниженная частота - это больший расход на запрос
+            await self.limiter.acquire(self.max_rate / self.rate)
+            # Пауза могла появиться, пока ждали токен
+            await self.wait_pause()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return None
+
+    def is_paused(self) -> bool:
+        return self.paused_until > time.monotonic()
+
+    async def wait_pause(self):
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def set_rate(self, rate: float):
+        self.rate = min(max(self.min_rate, rate), self.max_rate)
+
+    def set_limit(self, max_rate: float, time_period: float):
+        if max_rate == self.max_rate and time_period == self.time_period:
+            return
+        self.max_rate, self.time_period = max_rate, time_period
+        self.min_rate = min(self.min_rate, max_rate)
+        self.limiter = AsyncLimiter(max_rate, time_period)
+        self.set_rate(self.rate)
+
+    def update(self, status: int, headers):
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        retry_after = get_retry_after(headers)
+        if status == 429:
+            # Превышен лимит: ждем указанное API время и снижаем частоту вдвое
+            self.pause(retry_after if retry_after is not None else self.time_period)
+            self.set_rate(self.rate / 2)
+            logger.warning(f'Лимит запросов превышен, частота снижена до {self.rate:g}/{self.time_period:g} с')
+            return
+        if retry_after is not None:
+            self.pause(retry_after)
+
+        limit = next((_to_float(headers[name]) for name in LIMIT_HEADERS if name in headers), None)
+        period = _to_float(headers.get('x-lognex-retry-timeinterval'))
+        if limit and period:
+            # Мой склад сообщает и лимит, и длину периода - принимаем их как потолок
+            self.set_limit(limit, period / 1000)
+
+        remaining = next((_to_float(headers[name]) for name in REMAINING_HEADERS if name in headers), None)
+        if remaining is not None and remaining <= self.low_remaining:
+            reset = next((_to_float(headers[name]) * scale for name, scale in RESET_HEADERS
+                          if _to_float(headers.get(name)) is not None), None)
+            self.pause(reset if reset is not None else self.time_period / self.rate)
+        elif self.rate < self.max_rate and 200 <= status < 300:
+            self.set_rate(self.rate + self.recovery_step)
+
+
+class RateLimiterRegistry:
+    """Отдельный адаптивный ограничитель на каждый хост"""
+
+    def __init__(self, max_rate: float, time_period: float, host_limits: dict = None):
+        self.max_rate = max_rate
+        self.time_period = time_period
+        # Индивидуальные лимиты хостов: {'statistics-api.wildberries.ru': (1, 60)}
+        self.host_limits = host_limits or {}
+        self.limiters = {}
+
+    def get(self, url) -> HostRateLimiter:
+        host = get_host(url)
+        limiter = self.limiters.get(host)
+        if limiter is None:
+            max_rate, time_period = self.host_limits.get(host, (self.max_rate, self.time_period))
+            limiter = self.limiters[host] = HostRateLimiter(max_rate, time_period)
+        return limiter
+
+    def update(self, url, status: int, headers):
+        self.get(url).update(status, headers)
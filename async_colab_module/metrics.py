@@ -0,0 +1,152 @@
+import json
+import re
+import time
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+# Границы корзин гистограмм, секунд
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Служебные части пути, не несущие смысла эндпоинта: api, remap, v1, 1.2
+_PREFIX_SEGMENT = re.compile(r'^(api|remap|v\d+|\d+\.\d+)$')
+_ID_SEGMENT = re.compile(r'^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})$')
+
+
+def get_endpoint_template(url) -> str:
+    """Шаблон эндпоинта для группировки метрик: .../businesses/123/offer-mappings -> businesses/{id}/offer-mappings"""
+    segments = [segment for segment in urlsplit(str(url)).path.split('/') if segment]
+    while segments and _PREFIX_SEGMENT.match(segments[0]):
+        segments.pop(0)
+    return '/'.join('{id}' if _ID_SEGMENT.match(segment) else segment for segment in segments) or '/'
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'p99': round(self.quantile(0.99), 6),
+            'max': round(self.max, 6),
+        }
+
+
+class EndpointStats:
+    histogram_names = ('latency', 'queue_wait', 'limiter_wait')
+    counter_names = ('requests', 'errors', 'retries', 'bytes_received')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        # latency - запрос и чтение ответа, queue_wait - ожидание семафора, limiter_wait - ожидание лимита
+        self.histograms = {name: Histogram(buckets) for name in self.histogram_names}
+        self.counters = dict.fromkeys(self.counter_names, 0)
+        self.statuses = {}
+
+    def to_dict(self) -> dict:
+        return {
+            **{name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            **self.counters,
+            'statuses': dict(self.statuses),
+        }
+
+
+class RequestMetrics:
+    """Метрики запросов по хостам и шаблонам эндпоинтов с выгрузкой в JSON или текстовом формате Prometheus"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # {(host, endpoint): EndpointStats}
+        self.endpoints = {}
+
+    def get_stats(self, url) -> EndpointStats:
+        key = (urlsplit(str(url)).netloc, get_endpoint_template(url))
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints[key] = EndpointStats(self.buckets)
+        return stats
+
+    def observe(self, url, name: str, value: float):
+        self.get_stats(url).histograms[name].observe(value)
+
+    def count(self, url, name: str, value: int = 1):
+        self.get_stats(url).counters[name] += value
+
+    def record_status(self, url, status: int):
+        statuses = self.get_stats(url).statuses
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def reset(self):
+        self.endpoints.clear()
+
+    def to_dict(self) -> dict:
+        result = {}
+        for (host, endpoint), stats in sorted(self.endpoints.items()):
+            result.setdefault(host, {})[endpoint] = stats.to_dict()
+        return result
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, **kwargs)
+
+    def to_prometheus(self, prefix: str = 'api_client') -> str:
+        lines = []
+        for name in EndpointStats.histogram_names:
+            metric = f'{prefix}_{name}_seconds'
+            lines.append(f'# TYPE {metric} histogram')
+            for (host, endpoint), stats in sorted(self.endpoints.items()):
+                histogram = stats.histograms[name]
+                labels = f'host="{host}",endpoint="{endpoint}"'
+                total = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    total += count
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {total}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        for name in EndpointStats.counter_names:
+            metric = f'{prefix}_{name}_total'
+            lines.append(f'# TYPE {metric} counter')
+            for (host, endpoint), stats in sorted(self.endpoints.items()):
+                lines.append(f'{metric}{{host="{host}",endpoint="{endpoint}"}} {stats.counters[name]}')
+        metric = f'{prefix}_responses_total'
+        lines.append(f'# TYPE {metric} counter')
+        for (host, endpoint), stats in sorted(self.endpoints.items()):
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'{metric}{{host="{host}",endpoint="{endpoint}",status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+class Timer:
+    def __init__(self):
+        self.start = time.perf_counter()
+
+    def lap(self) -> float:
+        """Время с предыдущей отметки, секунд"""
+        now = time.perf_counter()
+        elapsed, self.start = now - self.start, now
+        return elapsed
@@ -2,38 +2,124 @@ import asyncio
 import logging
 import time
 
-from async_colab_module.utils import get_api_tokens
+import aiohttp
+
+from async_colab_module.utils import get_api_tokens, get_product_index, resolve_bundle_components
 from async_colab_module.base import AsyncHttpClient
+from async_colab_module.catalog_sync import sync_entity
+from async_colab_module.json_stream import project_fields
+from async_colab_module.scheduler import BULK, request_priority
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('MoySklad')
 
 
 class MoySklad(AsyncHttpClient):
-    def __init__(self, api_key: str, max_rete: int = 45, time_period: int = 3):
-        super().__init__(max_rete=max_rete, time_period=time_period)
+    def __init__(self, api_key: str, max_rete: int = 45, time_period: int = 3, **kwargs):
+        super().__init__(max_rete=max_rete, time_period=time_period, **kwargs)
         self.headers = {'Accept-Encoding': 'gzip', 'Authorization': api_key, 'Content-Type': 'application/json'}
         self.host = 'https://api.moysklad.ru/api/remap/1.2/'
 
-    async def get_with_pagination(self, url, limit=1000):
-        result = await self.get(url, params={'limit': 1, 'offset': 0})
-        items = []
-        if result:
-            size = result.get('meta', {}).get('size', 0)
-            if size:
-                request_list = [self.get(url, params={'limit': limit, 'offset': i}) for i in range(0, size + limit, limit)]
-                requests = await asyncio.gather(*request_list)
-                for request in requests:
-                    items += request.get('rows', [])
-        return items
-
-    async def get_products_list(self):
+    async def get_with_pagination(self, url, limit=1000, project=None, max_in_flight: int = 8, params=None):
+        pages = [page async for page in self.iter_pages(url, limit, project=project, max_in_flight=max_in_flight,
+                                                        params=params)]
+        # Страницы приходят по мере готовности, итоговый список - в порядке offset
+        pages.sort(key=lambda page: page[0])
+        return [row for _, rows in pages for row in rows]
+
+    async def iter_with_pagination(self, url, limit=1000, project=None, max_in_flight: int = 4, params=None):
+        """Отдает строки постранично по мере загрузки, в памяти не больше max_in_flight страниц"""
+        async for _, rows in self.iter_pages(url, limit, project=project, max_in_flight=max_in_flight,
+                                             params=params):
+            for row in rows:
+                yield row
+
+    async def iter_pages(self, url, limit=1000, project=None, max_in_flight: int = 4, params=None):
+        """Отдает (offset, rows) по мере готовности страниц. Первая страница запрашивается сразу с limit,
+        ее meta.size определяет остальные запросы, одновременно выполняется не больше max_in_flight"""
+        first = await self.spawn_bulk(self.get(url, params={**(params or {}), 'limit': limit, 'offset': 0}))
+        if not first:
+            logger.error(f'Не удалось получить первую страницу {url}')
+            return
+        rows = first.get('rows', [])
+        size = first.get('meta', {}).get('size', 0)
+        del first
+        yield 0, [project(row) for row in rows] if project else rows
+
+        offsets = iter(range(limit, size, limit))
+        pending = {}
+        try:
+            while True:
+                for offset in offsets:
+                    pending[self.spawn_bulk(self.get_page_rows(url, limit, offset, project, params))] = offset
+                    if len(pending) >= max_in_flight:
+                        break
+                if not pending:
+                    return
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    offset = pending.pop(task)
+                    rows = task.result()
+                    if rows is None:
+                        logger.error(f'Не удалось получить страницу {url} (offset={offset}), данные неполные')
+                        continue
+                    yield offset, rows
+        finally:
+            # Потребитель прекратил чтение раньше - незавершенные страницы не нужны
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    def spawn_bulk(coro):
+        """Задача с фоновым приоритетом, если вызывающий код не задал его сам. Приоритет задается
+        только на время создания задачи, чтобы не переносить его в код между выдачей страниц"""
+        with request_priority(BULK, override=False):
+            return asyncio.ensure_future(coro)
+
+    async def get_page_rows(self, url, limit, offset, project=None, params=None):
+        """Строки страницы или None при ошибке. С проекцией страница разбирается потоково.
+        Запрос идет мимо single_flight, поэтому отмена задачи страницы прерывает и сам запрос"""
+        params = {**(params or {}), 'limit': limit, 'offset': offset}
+        if project:
+            try:
+                return [row async for row in self.iter_json(url, params=params, key='rows', project=project,
+                                                            raise_errors=True)]
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return None
+        result = await self.get_direct(url, params=params)
+        return result.get('rows', []) if result else None
+
+    async def get_size(self, url, params=None):
+        """Число записей по meta.size (один запрос с limit=1), None при ошибке"""
+        result = await self.get(url, params={**(params or {}), 'limit': 1, 'offset': 0})
+        return result.get('meta', {}).get('size', 0) if result else None
+
+    async def get_products_list(self, snapshot=None):
+        """snapshot - локальная копия каталога (CatalogSnapshot): загружаются только изменения"""
         url = f'{self.host}entity/product'
+        if snapshot is not None:
+            await sync_entity(self, snapshot, 'product', url, limit=1000)
+            return snapshot.rows('product')
         return await self.get_with_pagination(url, limit=1000)
 
-    async def get_bundles(self):
-        url = f'{self.host}entity/bundle?expand=components.rows.assortment'
-        return await self.get_with_pagination(url, limit=100)
+    async def get_bundles(self, project=None, snapshot=None, products=None):
+        """products - товары из get_products_list: компоненты подставляются из индекса товаров вместо
+        expand=components.rows.assortment, страницы комплектов не содержат копий товаров"""
+        transform = project
+        if products is not None:
+            url = f'{self.host}entity/bundle?expand=components'
+            product_index = get_product_index(products)
+            transform = lambda bundle: resolve_bundle_components(bundle, product_index)
+            if project:
+                transform = lambda bundle: project(resolve_bundle_components(bundle, product_index))
+        else:
+            url = f'{self.host}entity/bundle?expand=components.rows.assortment'
+        # С любым expand Мой склад отдает не больше 100 строк на страницу
+        if snapshot is not None:
+            await sync_entity(self, snapshot, 'bundle', url, limit=100)
+            rows = snapshot.rows('bundle')
+            return [transform(row) for row in rows] if transform else rows
+        return await self.get_with_pagination(url, limit=100, project=transform)
 
     async def get_stock(self):
         url = f'{self.host}report/stock/all/current'
@@ -45,6 +131,23 @@ class MoySklad(AsyncHttpClient):
             logger.error('Не удалось получить данные о наличии.')
         return response_json
 
+    async def iter_stock(self, project=project_fields('assortmentId', 'quantity')):
+        """Потоковая выдача остатков: отчет не загружается в память целиком"""
+        url = f'{self.host}report/stock/all/current'
+        params = {'stockType': 'quantity', 'include': 'zeroLines'}
+        async for stock in self.iter_json(url, params=params, project=project):
+            yield stock
+
+    async def get_stock_dict(self):
+        """Остатки {assortmentId: quantity}, параллельные вызовы получают результат одной загрузки"""
+        async def load():
+            stocks_dict = {stock['assortmentId']: stock['quantity'] async for stock in self.iter_stock()}
+            if not stocks_dict:
+                logger.error('Не удалось получить данные о наличии.')
+            return stocks_dict
+
+        return await self.single_flight(('stock_dict',), load)
+
 
 if __name__ == '__main__':
     ms_token, wb_token, _ = get_api_tokens()
@@ -0,0 +1,83 @@
+from array import array
+
+
+class WBPriceIndex:
+    """Цены WB по размерам в компактных массивах: строка на размер (nmID, sizeID, techSize, цена,
+    цена со скидкой, скидка). Размеры одного nmID идут подряд, nm_rows хранит первую строку nmID.
+
+    get(nm_id) совместим с прежним словарем get_price_dict: {"price": цена со скидкой, "discount": скидка}
+    по первому размеру; get_size(nm_id, tech_size) - цена конкретного размера.
+    """
+
+    def __init__(self, goods=()):
+        self.nm_ids = array("q")
+        self.size_ids = array("q")
+        self.tech_sizes = []
+        self.prices = array("d")
+        self.discounted_prices = array("d")
+        self.discounts = array("q")
+        # {nmID: номер первой строки}
+        self.nm_rows = {}
+        # Одинаковые techSize ("0", "S", "M", ...) хранятся одной строкой
+        self._tech_size_cache = {}
+        for item in goods:
+            self.add(item)
+
+    def add(self, item):
+        nm_id = item["nmID"]
+        if nm_id in self.nm_rows:
+            return
+        sizes = item.get("sizes") or []
+        if not sizes:
+            return
+        self.nm_rows[nm_id] = len(self.nm_ids)
+        discount = int(item.get("discount") or 0)
+        for size in sizes:
+            tech_size = str(size.get("techSize", ""))
+            self.nm_ids.append(nm_id)
+            self.size_ids.append(size.get("sizeID") or 0)
+            self.tech_sizes.append(self._tech_size_cache.setdefault(tech_size, tech_size))
+            self.prices.append(size.get("price") or 0.0)
+            self.discounted_prices.append(size.get("discountedPrice") or 0.0)
+            self.discounts.append(discount)
+
+    def __len__(self):
+        return len(self.nm_rows)
+
+    def __contains__(self, nm_id):
+        return nm_id in self.nm_rows
+
+    def _rows(self, nm_id):
+        row = self.nm_rows[nm_id]
+        while row < len(self.nm_ids) and self.nm_ids[row] == nm_id:
+            yield row
+            row += 1
+
+    def _row(self, row) -> dict:
+        return {"price": self.discounted_prices[row], "discount": self.discounts[row]}
+
+    def get(self, nm_id, default=None):
+        row = self.nm_rows.get(nm_id)
+        return self._row(row) if row is not None else default
+
+    def __getitem__(self, nm_id):
+        return self._row(self.nm_rows[nm_id])
+
+    def get_size(self, nm_id, tech_size=None, default=None):
+        """Цена размера tech_size; неизвестный размер - цена первого размера nmID"""
+        if nm_id not in self.nm_rows:
+            return default
+        if tech_size is not None:
+            tech_size = str(tech_size)
+            for row in self._rows(nm_id):
+                if self.tech_sizes[row] == tech_size:
+                    return self._row(row)
+        return self._row(self.nm_rows[nm_id])
+
+    def sizes(self, nm_id) -> list:
+        """Все размеры nmID: [{"sizeID", "techSize", "price", "discountedPrice", "discount"}]"""
+        if nm_id not in self.nm_rows:
+            return []
+        return [{"sizeID": self.size_ids[row], "techSize": self.tech_sizes[row], "price": self.prices[row],
+                 "discountedPrice": self.discounted_prices[row], "discount": self.discounts[row]}
+                for row in self._rows(nm_id)]
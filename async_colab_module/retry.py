@@ -0,0 +1,56 @@
+import asyncio
+import random
+
+import aiohttp
+
+from async_colab_module.limiter import get_retry_after
+
+# Статусы, при которых повтор запроса имеет смысл
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class RetryPolicy:
+    """Политика повторов: экспоненциальная пауза с джиттером, учет Retry-After и бюджет времени на вызов"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 budget: float = 60.0, retry_statuses=RETRY_STATUSES, jitter: bool = True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Суммарное время ожидания между попытками одного вызова, секунд
+        self.budget = budget
+        self.retry_statuses = frozenset(retry_statuses)
+        self.jitter = jitter
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in self.retry_statuses
+        # Таймауты и обрывы соединения (в т.ч. connection reset)
+        return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError, ConnectionError))
+
+    def get_delay(self, attempt: int, error: Exception = None) -> float:
+        """Пауза перед попыткой attempt + 1 (attempt считается с нуля)"""
+        retry_after = get_retry_after(getattr(error, 'headers', None))
+        if retry_after is not None:
+            # API указал время ожидания - немного разносим повторы разных корутин
+            return retry_after + (random.uniform(0, self.base_delay) if self.jitter else 0.0)
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        # Full jitter, чтобы повторы параллельных запросов не совпадали по времени
+        return random.uniform(0, delay) if self.jitter else delay
+
+    async def call(self, request, on_retry=None):
+        """Вызывает request() с повторами. Исключение последней попытки пробрасывается наружу"""
+        waited = 0.0
+        for attempt in range(self.max_attempts):
+            try:
+                return await request()
+            except Exception as error:
+                if not self.is_retryable(error) or attempt == self.max_attempts - 1:
+                    raise
+                delay = self.get_delay(attempt, error)
+                if waited + delay > self.budget:
+                    raise
+                waited += delay
+                if on_retry:
+                    on_retry(error, attempt, delay)
+                await asyncio.sleep(delay)
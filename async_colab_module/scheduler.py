@@ -0,0 +1,75 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+from contextlib import contextmanager
+
+# Классы приоритета запросов: меньше - раньше
+INTERACTIVE = 0
+NORMAL = 1
+BULK = 2
+
+current_priority = contextvars.ContextVar('request_priority', default=NORMAL)
+
+
+@contextmanager
+def request_priority(priority: int, override: bool = True):
+    """Задает приоритет запросов внутри блока, в том числе для задач, созданных в нем через gather.
+
+    override=False - не менять приоритет, если вызывающий код уже задал его явно.
+    """
+    if not override and current_priority.get() != NORMAL:
+        yield
+        return
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class PrioritySemaphore:
+    """Семафор, который при освобождении пропускает ожидающего с наивысшим приоритетом,
+    а внутри одного приоритета - в порядке очереди"""
+
+    def __init__(self, value: int = 1):
+        self._value = value
+        # heap: (приоритет, номер в очереди, future)
+        self._waiters = []
+        self._counter = itertools.count()
+
+    def locked(self) -> bool:
+        return self._value == 0
+
+    async def acquire(self, priority: int = None):
+        if priority is None:
+            priority = current_priority.get()
+        # Свободные разрешения бывают только при пустой очереди: release сначала отдает их ожидающим
+        if self._value > 0:
+            self._value -= 1
+            return True
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Разрешение уже передано отмененной задаче - возвращаем его следующему
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Разрешение передается ожидающему напрямую, счетчик не меняется
+                future.set_result(None)
+                return
+        self._value += 1
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+
+import aiohttp
+
+logger = logging.getLogger('API')
+
+
+class SessionRegistry:
+    """Общий пул соединений процесса: одна aiohttp-сессия на event loop для всех клиентов"""
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 10, ttl_dns_cache: int = 300,
+                 keepalive_timeout: float = 30, timeout: float = 60):
+        self.limit = limit
+        # Не более limit_per_host соединений к одному хосту от всех клиентов вместе
+        self.limit_per_host = limit_per_host
+        # Кэш DNS, секунд
+        self.ttl_dns_cache = ttl_dns_cache
+        # Сколько держать простаивающее соединение открытым, секунд
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        # {loop: [session, количество клиентов]}
+        self._sessions = {}
+
+    def create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(ssl=False, limit=self.limit, limit_per_host=self.limit_per_host,
+                                         ttl_dns_cache=self.ttl_dns_cache,
+                                         keepalive_timeout=self.keepalive_timeout)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    def acquire(self) -> aiohttp.ClientSession:
+        """Возвращает сессию текущего event loop, создавая ее при первом обращении"""
+        loop = asyncio.get_running_loop()
+        # Сессии закрытых loop (например, после asyncio.run) больше не используются
+        for closed_loop in [key for key in self._sessions if key.is_closed()]:
+            del self._sessions[closed_loop]
+        entry = self._sessions.get(loop)
+        if entry is None or entry[0].closed:
+            entry = self._sessions[loop] = [self.create_session(), 0]
+        entry[1] += 1
+        return entry[0]
+
+    async def release(self, session: aiohttp.ClientSession):
+        """Освобождает сессию клиента, последняя освобожденная сессия закрывается"""
+        for loop, entry in list(self._sessions.items()):
+            if entry[0] is session:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._sessions[loop]
+                    await session.close()
+                return
+        if not session.closed:
+            await session.close()
+
+    async def close(self):
+        """Закрывает сессию текущего event loop независимо от числа клиентов"""
+        entry = self._sessions.pop(asyncio.get_running_loop(), None)
+        if entry:
+            await entry[0].close()
+
+
+shared_sessions = SessionRegistry()
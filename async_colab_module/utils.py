@@ -2,6 +2,9 @@ import os
 import re
 import asyncio
 
+from async_colab_module.base import IncompleteDataError
+from async_colab_module.price_index import WBPriceIndex
+
 
 def get_api_tokens():
     try:
@@ -62,6 +65,45 @@ def get_product_id_from_url(url):
         return None
 
 
+def get_product_index(products):
+    """Индекс товаров {id: товар} для подстановки в компоненты комплектов"""
+    return {product["id"]: product for product in products}
+
+
+def resolve_bundle_components(bundle, product_index):
+    """Подставляет товары из индекса в компоненты комплекта, как expand=components.rows.assortment.
+    Компоненты, которых нет в индексе (модификации, услуги), остаются ссылками"""
+    components = bundle.get("components", {})
+    rows = []
+    for component in components.get("rows", []):
+        product = product_index.get(get_product_id_from_url(component["assortment"]["meta"]["href"]))
+        rows.append({**component, "assortment": product} if product else component)
+    return {**bundle, "components": {**components, "rows": rows}}
+
+
+def project_bundle(bundle):
+    """Оставляет в комплекте только поля, используемые в отчетах"""
+    components = bundle.get("components", {}).get("rows", [])
+    return {
+        "id": bundle.get("id"),
+        "name": bundle.get("name"),
+        "code": bundle.get("code"),
+        "article": bundle.get("article"),
+        "pathName": bundle.get("pathName", ""),
+        "salePrices": bundle.get("salePrices", []),
+        "attributes": bundle.get("attributes", []),
+        "components": {
+            "rows": [
+                {
+                    "quantity": component["quantity"],
+                    "assortment": {"meta": {"href": component["assortment"]["meta"]["href"]}},
+                }
+                for component in components
+            ]
+        },
+    }
+
+
 def get_stock_for_bundle(stocks_dict, product):
     product_bundles = product["components"]["rows"]
     product_stock = 0.0
@@ -74,47 +116,56 @@ def get_stock_for_bundle(stocks_dict, product):
     return product_stock
 
 
+def get_bundle_stock_index(products):
+    """products - список комплектов или уже построенный BundleStockIndex (его можно переиспользовать
+    между обновлениями остатков)"""
+    from async_colab_module.bundle_stock import BundleStockIndex
+
+    return products if isinstance(products, BundleStockIndex) else BundleStockIndex(products)
+
+
 async def get_ms_stocks_dict(ms_client, products):
     print("Получение остатков номенклатуры")
-    stocks = await ms_client.get_stock()
-    stocks_dict = {stock["assortmentId"]: stock["quantity"] for stock in stocks}
-    wb_stocks_dict = {
-        int(product["code"]): get_stock_for_bundle(stocks_dict, product)
-        for product in products
-    }
-    return wb_stocks_dict
+    stocks_dict = await ms_client.get_stock_dict()
+    return get_bundle_stock_index(products).to_dict(stocks_dict, key="code")
 
 
 async def get_ms_stocks_article_dict(ms_client, products):
     print("Получение остатков номенклатуры по артикулу")
-    stocks = await ms_client.get_stock()
-    stocks_dict = {stock["assortmentId"]: stock["quantity"] for stock in stocks}
-    wb_stocks_dict = {
-        product["article"]: get_stock_for_bundle(stocks_dict, product)
-        for product in products
-    }
-    return wb_stocks_dict
-
-
-async def get_price_dict(wb_client):
-    data = await wb_client.get_product_prices()
-    # TODO: Добавить возможность получения данных по другим размерам, либо изменить источник
-    price_dict = {
-        d["nmID"]: {
-            "price": d["sizes"][0]["discountedPrice"],
-            "discount": d["discount"],
-        }
-        for d in data
-        if len(d["sizes"]) == 1
-    }
-    return price_dict
+    stocks_dict = await ms_client.get_stock_dict()
+    return get_bundle_stock_index(products).to_dict(stocks_dict, key="article")
+
 
+async def get_price_dict(wb_client, store=None):
+    """Индекс цен WB по всем размерам (WBPriceIndex), строится за один проход по выгрузке цен"""
+    print("Получение актуальных цен и дисконта")
+    price_index = WBPriceIndex()
+    goods_list = [] if store is not None else None
+    complete = True
+    try:
+        async for goods in wb_client.iter_product_prices():
+            price_index.add(goods)
+            if goods_list is not None:
+                goods_list.append(goods)
+    except IncompleteDataError:
+        complete = False
+    if store is not None:
+        # Хранилище заменяется только полным списком цен. При ошибке загрузки отчет строится
+        # по сохраненным ценам, если они есть
+        if complete and goods_list:
+            store.set_wb_prices(goods_list)
+        else:
+            stored = store.wb_prices()
+            if stored or not goods_list:
+                price_index = WBPriceIndex(stored)
+    return price_index
 
-async def get_dict_for_report(products, ms_client, wb_client, fbs=True):
+
+async def get_dict_for_report(products, ms_client, wb_client, fbs=True, store=None):
     category_dict_ = get_category_dict(wb_client, fbs=fbs)
     tariffs_logistic_data_ = wb_client.get_tariffs_for_box()
     ms_stocks_dict_ = get_ms_stocks_dict(ms_client, products)
-    wb_prices_dict_ = get_price_dict(wb_client)
+    wb_prices_dict_ = get_price_dict(wb_client, store=store)
 
     category_dict, tariffs_logistic_data, ms_stocks_dict, wb_prices_dict = (
         await asyncio.gather(
@@ -125,6 +176,7 @@ async def get_dict_for_report(products, ms_client, wb_client, fbs=True):
         "ms_stocks_dict": ms_stocks_dict,
         "category_dict": category_dict,
         "tariffs_data": tariffs_logistic_data,
+        "tariff_index": TariffIndex(tariffs_logistic_data) if tariffs_logistic_data else None,
         "wb_prices_dict": wb_prices_dict,
     }
 
@@ -152,6 +204,19 @@ def get_value_by_name(elements, name):
     )
 
 
+def parse_tariff(tariff):
+    """Коэффициенты логистики склада из warehouseList (числа в ответе - строки с запятой)"""
+    return {
+        "KTR": 1.0,
+        "TARIFF_FOR_BASE_L": float(tariff["boxDeliveryBase"].replace(",", ".")),
+        "TARIFF_BASE": 1,
+        "TARIFF_OVER_BASE": float(tariff["boxDeliveryLiter"].replace(",", ".")),
+        "WH_COEFFICIENT": round(
+            float(tariff["boxDeliveryAndStorageExpr"].replace(",", ".")) / 100, 2
+        ),
+    }
+
+
 def get_logistic_dict(tariffs_data, warehouse_name="Маркетплейс"):
     tariff = find_warehouse_by_name(
         tariffs_data["response"]["data"]["warehouseList"], warehouse_name
@@ -161,16 +226,34 @@ def get_logistic_dict(tariffs_data, warehouse_name="Маркетплейс"):
             tariffs_data["response"]["data"]["warehouseList"], "Коледино"
         )
     # Логистика
-    logistic_dict = {
-        "KTR": 1.0,
-        "TARIFF_FOR_BASE_L": float(tariff["boxDeliveryBase"].replace(",", ".")),
-        "TARIFF_BASE": 1,
-        "TARIFF_OVER_BASE": float(tariff["boxDeliveryLiter"].replace(",", ".")),
-        "WH_COEFFICIENT": round(
-            float(tariff["boxDeliveryAndStorageExpr"].replace(",", ".")) / 100, 2
-        ),
-    }
-    return logistic_dict
+    return parse_tariff(tariff)
+
+
+class TariffIndex(dict):
+    """Коэффициенты логистики {склад: словарь get_logistic_dict} по одному снимку get_tariffs_for_box.
+    Для склада, которого нет в тарифах, возвращаются коэффициенты Коледино"""
+
+    def __init__(self, tariffs_data):
+        super().__init__()
+        self.tariffs_data = tariffs_data
+        for tariff in tariffs_data["response"]["data"]["warehouseList"]:
+            # Как find_warehouse_by_name: при повторе имени действует первая запись
+            if tariff["warehouseName"] not in self:
+                self[tariff["warehouseName"]] = parse_tariff(tariff)
+        self.default = dict.get(self, "Коледино")
+
+    def __missing__(self, warehouse_name):
+        if self.default is None:
+            raise KeyError(warehouse_name)
+        return self.default
+
+
+def get_tariff_index(base_dict):
+    """Индекс тарифов из base_dict; если его нет или он построен по другому снимку тарифов - строится заново"""
+    tariff_index = base_dict.get("tariff_index")
+    if tariff_index is None or tariff_index.tariffs_data is not base_dict["tariffs_data"]:
+        tariff_index = base_dict["tariff_index"] = TariffIndex(base_dict["tariffs_data"])
+    return tariff_index
 
 
 def create_prices_dict(prices_list: list) -> dict:
@@ -223,23 +306,22 @@ def get_logistics(
     return logistics
 
 
-def get_order_data_fbo(order, product, base_dict, acquiring=1.5):
-    wb_prices_dict = base_dict["wb_prices_dict"]
-    logistic_dict = get_logistic_dict(
-        base_dict["tariffs_data"], warehouse_name=order.get("warehouseName", "Коледино")
-    )
+def get_wb_price(wb_prices_dict, nm_id, tech_size=None):
+    """Цена размера из заказа; для прежнего словаря {nmID: {...}} - цена по nmID"""
+    if isinstance(wb_prices_dict, WBPriceIndex):
+        return wb_prices_dict.get_size(nm_id, tech_size, default={})
+    return wb_prices_dict.get(nm_id, {})
 
-    nm_id = order.get("nmId", "")
-    sale_prices = product.get("salePrices", [])
-    prices_dict = create_prices_dict(sale_prices)
 
+def get_price_and_discount(wb_price, prices_dict):
+    """Цена и скидка WB; если в WB их нет - по ценам WB из Мой склад"""
     # Получение цены
-    price = wb_prices_dict.get(nm_id, {}).get("price")
+    price = wb_price.get("price")
     if not price:
         price = prices_dict.get("Цена WB после скидки", 0) / 100
 
     # Получение скидки
-    discount = wb_prices_dict.get(nm_id, {}).get("discount")
+    discount = wb_price.get("discount")
     if not discount:
         price_before_discount = prices_dict.get("Цена WB до скидки", 0.0)
         price_after_discount = prices_dict.get("Цена WB после скидки", 0.0)
@@ -249,14 +331,48 @@ def get_order_data_fbo(order, product, base_dict, acquiring=1.5):
             ) * 100
         else:
             discount = 0
+    return price, discount
 
-    cost_price_c = prices_dict.get("Цена основная", 0.0)
-    cost_price = cost_price_c / 100
-    order_price = round(order.get("finishedPrice", 0.0), 1)
 
-    attributes = product.get("attributes", [])
-    attributes_dict = create_attributes_dict(attributes)
-    volume = get_product_volume(attributes_dict)
+class ProductRecord:
+    """Данные товара Мой склад для отчетов, разобранные один раз: цены (словарь create_prices_dict),
+    себестоимость, объем и категория из атрибутов"""
+
+    __slots__ = ("name", "article", "prices_dict", "cost_price", "volume", "category")
+
+    def __init__(self, product):
+        self.name = product.get("name", "")
+        self.article = product.get("article", "")
+        self.prices_dict = create_prices_dict(product.get("salePrices", []))
+        self.cost_price = self.prices_dict.get("Цена основная", 0.0) / 100
+        attributes_dict = create_attributes_dict(product.get("attributes", []))
+        self.volume = get_product_volume(attributes_dict)
+        self.category = attributes_dict.get("Категория товара")
+
+
+def get_product_record(product):
+    """ProductRecord товара; готовая запись возвращается как есть"""
+    return product if isinstance(product, ProductRecord) else ProductRecord(product)
+
+
+def create_record_index(elements):
+    """Как create_code_index, но значения - ProductRecord: {code: запись}"""
+    return {code: get_product_record(element) for code, element in create_code_index(elements).items()}
+
+
+def get_order_data_fbo(order, product, base_dict, acquiring=1.5):
+    wb_prices_dict = base_dict["wb_prices_dict"]
+    logistic_dict = get_tariff_index(base_dict)[order.get("warehouseName", "Коледино")]
+
+    # product - товар Мой склад или ProductRecord из create_record_index (без повторного разбора)
+    record = get_product_record(product)
+    nm_id = order.get("nmId", "")
+
+    wb_price = get_wb_price(wb_prices_dict, nm_id, order.get("techSize"))
+    price, discount = get_price_and_discount(wb_price, record.prices_dict)
+
+    cost_price = record.cost_price
+    order_price = round(order.get("finishedPrice", 0.0), 1)
 
     logistics = get_logistics(
         logistic_dict["KTR"],
@@ -264,10 +380,10 @@ def get_order_data_fbo(order, product, base_dict, acquiring=1.5):
         logistic_dict["TARIFF_BASE"],
         logistic_dict["TARIFF_OVER_BASE"],
         logistic_dict["WH_COEFFICIENT"],
-        volume,
+        record.volume,
     )
 
-    category = order.get("subject", attributes_dict["Категория товара"])
+    category = order.get("subject", record.category)
     # Поставил 30% комиссии по умолчанию, если не найдено
     commission = base_dict.get("category_dict", {}).get(category, 30)
 
@@ -286,9 +402,9 @@ def get_order_data_fbo(order, product, base_dict, acquiring=1.5):
     order_profitability = round(order_profit / order_price * 100, 1)
 
     data = {
-        "name": product.get("name", ""),
+        "name": record.name,
         "nm_id": nm_id,
-        "article": product.get("article", ""),
+        "article": record.article,
         "stock": base_dict.get("ms_stocks_dict", {}).get(nm_id, 0),
         "order_create": order.get("date", ""),
         "order_name": order.get("sticker", "0"),
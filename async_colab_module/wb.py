@@ -1,18 +1,34 @@
 import asyncio
+import itertools
 import logging
 import time
+from collections import deque
 from datetime import datetime
 
 from async_colab_module.utils import get_api_tokens
-from async_colab_module.base import AsyncHttpClient
+from async_colab_module.base import ApiResponseError, AsyncHttpClient, IncompleteDataError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('WB')
 
+# Статусы обработанных задач загрузки цен: 3 - без ошибок, 4 - отменена, 5 - есть ошибки, 6 - ошибки во всех товарах
+PRICE_TASK_FINAL_STATUSES = {3, 4, 5, 6}
+PRICE_TASK_ERROR_STATUSES = {5, 6}
+
 
 class WB(AsyncHttpClient):
-    def __init__(self, api_key: str, max_rete: int = 45, time_period: int = 3):
-        super().__init__(max_rete=max_rete, time_period=time_period)
+    # Комиссии и тарифы меняются не чаще раза в сутки
+    cache_ttls = {
+        'common-api.wildberries.ru/api/v1/tariffs/commission': 24 * 3600,
+        'common-api.wildberries.ru/api/v1/tariffs/box': 24 * 3600,
+    }
+    # Методы статистики принимают один запрос в минуту
+    host_limits = {'statistics-api.wildberries.ru': (1, 60)}
+    # Строк в одном ответе статистики заказов
+    orders_page_size = 80000
+
+    def __init__(self, api_key: str, max_rete: int = 45, time_period: int = 3, **kwargs):
+        super().__init__(max_rete=max_rete, time_period=time_period, **kwargs)
         # ssl_context = ssl.create_default_context()
         # ssl_context.check_hostname = False
         # ssl_context.verify_mode = ssl.CERT_NONE
@@ -38,25 +54,118 @@ class WB(AsyncHttpClient):
             logger.error('Не удалось получить данные о тарифах логистики.')
         return result if result else []
 
-    async def get_product_prices(self):
+    async def get_product_prices(self, prefetch: int = 4):
+        """Все товары с ценами или None, если список получен не полностью"""
         print(f'Получение актуальных цен и дисконта')
+        try:
+            return [goods async for goods in self.iter_product_prices(prefetch=prefetch)]
+        except IncompleteDataError:
+            return None
+
+    async def iter_product_prices(self, limit: int = 1000, prefetch: int = 4):
+        """Товары с ценами по мере загрузки, в порядке offset, до первой неполной или пустой страницы.
+        Первая страница запрашивается одна; пока страницы приходят полными, prefetch следующих
+        запрашиваются параллельно. limit не больше максимума API (1000), иначе любая страница окажется неполной.
+        Если страница не загрузилась, выдача прерывается ошибкой IncompleteDataError"""
         url = 'https://discounts-prices-api.wb.ru/api/v2/list/goods/filter'
-        params = {'limit': 1000, 'offset': 0}
+        offsets = itertools.count(0, limit)
 
-        products_list = []
-        while True:
-            result = await self.get(url, params)
-            if result:
+        def request_page():
+            # get_direct: отмена задачи прерывает запрос, лишние страницы не расходуют лимит WB
+            offset = next(offsets)
+            return offset, asyncio.ensure_future(self.get_direct(url, {'limit': limit, 'offset': offset}))
+
+        pages = deque([request_page()])
+        try:
+            while pages:
+                offset, page = pages.popleft()
+                result = await page
+                if not result:
+                    logger.error('Не удалось получить данные о ценах.')
+                    raise IncompleteDataError(f'Цены WB получены не полностью: ошибка на странице offset={offset}')
                 list_goods = result.get('data', {}).get('listGoods', [])
-                if list_goods:
-                    products_list += list_goods
-                    params['offset'] += params['limit']
-                else:
-                    break
-            else:
-                logger.error('Не удалось получить данные о ценах.')
-                break
-        return products_list
+                for goods in list_goods:
+                    yield goods
+                if len(list_goods) < limit:
+                    return
+                while len(pages) < prefetch:
+                    pages.append(request_page())
+        finally:
+            # Страницы за концом списка и незабранные потребителем больше не нужны
+            for _, page in pages:
+                page.cancel()
+
+    async def upload_prices(self, updates: list, batch_size: int = 1000, poll_interval: float = 5,
+                            timeout: float = 600):
+        """Загрузка цен и скидок: updates - [{'nmID': 123, 'price': 1000, 'discount': 30}, ...].
+
+        Обновления делятся на пакеты по batch_size (максимум API - 1000 товаров), пакеты отправляются
+        параллельно в пределах лимита хоста, затем статусы задач опрашиваются каждые poll_interval секунд.
+        Возвращает {'tasks': {id задачи: статус}, 'errors': [товары с errorText], 'rejected': [не принятые товары]}
+        """
+        url = 'https://discounts-prices-api.wb.ru/api/v2/upload/task'
+        batches = [updates[i: i + batch_size] for i in range(0, len(updates), batch_size)]
+        logger.info(f'Загрузка цен: {len(updates)} товаров, {len(batches)} пакетов')
+        results = await asyncio.gather(*[self.handle_request_errors(self._post_upload_task, 'POST', url,
+                                                                    json={'data': batch})
+                                         for batch in batches])
+
+        report = {'tasks': {}, 'errors': [], 'rejected': []}
+        task_ids = []
+        for batch, result in zip(batches, results):
+            task_id = ((result or {}).get('data') or {}).get('id')
+            if not task_id:
+                error_text = (result or {}).get('errorText') or 'нет ответа'
+                logger.error(f'Пакет из {len(batch)} товаров не принят: {error_text}')
+                report['rejected'] += [{**item, 'errorText': error_text} for item in batch]
+                continue
+            task_ids.append(task_id)
+
+        statuses = await asyncio.gather(*[self.wait_price_task(task_id, poll_interval, timeout)
+                                          for task_id in task_ids])
+        for task_id, status in zip(task_ids, statuses):
+            report['tasks'][task_id] = status
+            if status in PRICE_TASK_ERROR_STATUSES:
+                report['errors'] += await self.get_price_task_errors(task_id)
+        logger.info(f'Загрузка цен завершена: задач {len(task_ids)}, ошибок по товарам {len(report["errors"])}, '
+                    f'не принято {len(report["rejected"])}')
+        return report
+
+    async def _post_upload_task(self, method, url, json=None):
+        """Отправка пакета цен. Отказ 4xx возвращается телом ответа, чтобы errorText попал в отчет"""
+        try:
+            return await self._request(method, url, json=json)
+        except ApiResponseError as e:
+            if e.status == 429 or not isinstance(e.body, dict):
+                raise
+            return e.body
+
+    async def wait_price_task(self, task_id: int, poll_interval: float = 5, timeout: float = 600):
+        """Статус обработанной задачи загрузки цен или None, если задача не обработана за timeout секунд"""
+        url = 'https://discounts-prices-api.wb.ru/api/v2/history/tasks'
+        deadline = time.monotonic() + timeout
+        while True:
+            result = await self.get(url, {'uploadID': task_id})
+            status = ((result or {}).get('data') or {}).get('status')
+            if status in PRICE_TASK_FINAL_STATUSES:
+                return status
+            if time.monotonic() + poll_interval > deadline:
+                logger.error(f'Задача загрузки цен {task_id} не обработана за {timeout:g} секунд')
+                return None
+            await asyncio.sleep(poll_interval)
+
+    async def get_price_task_errors(self, task_id: int, limit: int = 1000):
+        """Товары задачи загрузки цен с ошибками (errorText)"""
+        url = 'https://discounts-prices-api.wb.ru/api/v2/history/goods/task'
+        errors = []
+        offset = 0
+        while True:
+            result = await self.get(url, {'uploadID': task_id, 'limit': limit, 'offset': offset})
+            goods = ((result or {}).get('data') or {}).get('historyGoods') or []
+            errors += [item for item in goods if item.get('errorText')]
+            if len(goods) < limit:
+                return errors
+            offset += limit
 
     async def get_orders(self, from_data):
         url = 'https://statistics-api.wildberries.ru/api/v1/supplier/orders'
@@ -64,32 +173,103 @@ class WB(AsyncHttpClient):
         result = await self.get(url, params)
         if not result:
             logger.error('Не удалось получить данные о заказах.')
-        return result.json() if result else []
+        return result if result else []
 
-    async def get_orders_fbs(self, from_date=None, to_date=None):
+    async def iter_order_changes(self, date_from: str):
+        """Страницы заказов с lastChangeDate не раньше date_from (flag=0). Следующая страница
+        запрашивается с наибольшим lastChangeDate предыдущей, пока ответ не станет неполным"""
+        url = 'https://statistics-api.wildberries.ru/api/v1/supplier/orders'
+        while True:
+            rows = await self.get(url, {'dateFrom': date_from, 'flag': 0})
+            if rows is None:
+                logger.error('Не удалось получить данные о заказах.')
+                return
+            if not rows:
+                return
+            yield rows
+            cursor = max(row['lastChangeDate'] for row in rows)
+            if len(rows) < self.orders_page_size:
+                return
+            if cursor == date_from:
+                logger.warning(f'Все заказы страницы изменены в {cursor}, продолжение недоступно')
+                return
+            date_from = cursor
+
+    async def get_orders_fbs(self, from_date=None, to_date=None, window: int = None):
+        return [order async for order in self.iter_orders_fbs(from_date, to_date, window=window)]
+
+    async def iter_orders_fbs(self, from_date=None, to_date=None, window: int = None, store=None,
+                              limit: int = 1000, buffer: int = 4):
+        """Заказы FBS по мере загрузки страниц курсором next. Даты - unix-время в секундах.
+
+        window - длина окна в секундах: период [from_date, to_date] делится на окна, которые загружаются
+        параллельно, в памяти не больше buffer страниц. store - CatalogStore для сохранения курсоров окон:
+        прерванная выгрузка того же периода продолжается после последней выданной страницы.
+        Завершенные окна с прошедшим dateTo повторно не запрашиваются, открытые (без dateTo или
+        с dateTo в будущем) продолжаются с последнего курсора и отдают только новые заказы.
+        """
         url = self.host + 'api/v3/orders'
-        params = {'limit': 1000, 'next': 0}
-        if from_date:
-            params['dateFrom'] = from_date
-        if to_date:
-            params['dateTo'] = to_date
+        if window and from_date and to_date:
+            windows = [(start, min(start + window - 1, to_date)) for start in range(from_date, to_date + 1, window)]
+        else:
+            windows = [(from_date, to_date)]
+        queue = asyncio.Queue(maxsize=buffer)
 
-        orders_fbs = []
-        while True:
-            result = await self.get(url, params)
-            if result:
-                response_json = result.json()
-                orders_list = response_json.get('orders')
-                next_cursor = response_json.get('next')
-                if orders_list and next_cursor:
-                    orders_fbs += orders_list
-                    params['next'] = next_cursor
-                else:
-                    break
-            else:
-                logger.error('Не удалось получить данные о заказах FBS.')
-                break
-        return orders_fbs
+        async def fetch(state_name, date_from, date_to, cursor):
+            params = {'limit': limit, 'next': cursor}
+            if date_from:
+                params['dateFrom'] = date_from
+            if date_to:
+                params['dateTo'] = date_to
+            # Окно с прошедшим dateTo загружается один раз. Открытое окно (без dateTo или с dateTo
+            # в будущем) может пополниться: для него сохраняется курсор, следующий вызов продолжает с него
+            closed = date_to is not None and date_to < time.time()
+            try:
+                while True:
+                    result = await self.get(url, dict(params))
+                    if not result:
+                        logger.error('Не удалось получить данные о заказах FBS.')
+                        await queue.put((state_name, [], None, True, None))
+                        return
+                    orders = result.get('orders') or []
+                    cursor = result.get('next')
+                    # Последняя страница может прийти и с курсором, и без него - ее заказы не теряем
+                    last = not orders or not cursor or len(orders) < limit
+                    if last and closed:
+                        cursor = 'done'
+                    await queue.put((state_name, orders, cursor or params['next'], last, None))
+                    if last:
+                        return
+                    params['next'] = cursor
+            except Exception as e:
+                # Окно должно завершиться и при ошибке, иначе потребитель ждет очередь бесконечно
+                await queue.put((state_name, [], None, True, e))
+
+        tasks = []
+        for date_from, date_to in windows:
+            state_name = f'wb:orders_fbs:{date_from}:{date_to}'
+            cursor = store.get_state(state_name)[0] if store is not None else None
+            if cursor == 'done':
+                continue
+            tasks.append(asyncio.ensure_future(fetch(state_name, date_from, date_to, int(cursor or 0))))
+        active = len(tasks)
+        try:
+            while active:
+                state_name, orders, cursor, last, error = await queue.get()
+                if error is not None:
+                    logger.error(f'Ошибка загрузки заказов FBS: {str(error) or repr(error)}')
+                    raise error
+                for order in orders:
+                    yield order
+                if last:
+                    active -= 1
+                # Курсор сохраняется, когда потребитель забрал все заказы страницы
+                if cursor is not None and store is not None:
+                    store.set_state(state_name, str(cursor))
+                    store.save()
+        finally:
+            for task in tasks:
+                task.cancel()
 
 
 if __name__ == '__main__':
@@ -107,7 +287,7 @@ if __name__ == '__main__':
             # Печать результатов
             print(len(commission_))
             print(len(tariffs_))
-            print(f"Количество товаров с ценой: {len(product_prices_)}")
+            print(f"Количество товаров с ценой: {len(product_prices_ or [])}")
             print(time.time() - start_time)
 
     asyncio.run(main())
@@ -11,8 +11,11 @@ logger = logging.getLogger(name="YandexMarket")
 
 
 class YM(AsyncHttpClient):
-    def __init__(self, api_key: str, max_rete: int = 45, time_period: int = 3):
-        super().__init__(max_rete=max_rete, time_period=time_period)
+    # Тарифы пересчитываются не чаще раза в сутки
+    cache_ttls = {"api.partner.market.yandex.ru/tariffs/calculate": 24 * 3600}
+
+    def __init__(self, api_key: str, max_rete: int = 45, time_period: int = 3, **kwargs):
+        super().__init__(max_rete=max_rete, time_period=time_period, **kwargs)
         self.headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
@@ -42,7 +45,7 @@ class YM(AsyncHttpClient):
             logger.error("Не удалось получить данные о карточках товара")
         return (
             result.get("result", {}).get("offerMappings", [])
-            if result.get("status") == "OK"
+            if result and result.get("status") == "OK"
             else []
         )
 
@@ -66,7 +69,7 @@ class YM(AsyncHttpClient):
             logger.error("Не удалось получить данные о карточках товара.")
         return (
             result.get("result", {}).get("offers", [])
-            if result.get("status") == "OK"
+            if result and result.get("status") == "OK"
             else []
         )
 
@@ -0,0 +1,211 @@
+"""Замеры производительности конвейеров на синтетических каталогах через локальный стенд API.
+
+Запуск:
+    python -m benchmarks.bench_pipeline --sizes 1000 10000 --orders 5000 > bench_output.txt
+    python -m benchmarks.bench_pipeline --sizes 100000 --scenarios ms_pagination wb_prices --json result.json
+
+Стенд (FakeApiServer) работает в отдельном процессе, каждый сценарий - в своем процессе,
+поэтому пиковый RSS относится только к клиентской стороне сценария.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+from async_colab_module.cache import ResponseCache
+from async_colab_module.fake_api import FakeApiServer, FakeCatalog
+from async_colab_module.metrics import RequestMetrics
+
+
+def get_peak_rss_mb() -> float:
+    # На Linux ru_maxrss в килобайтах, на macOS - в байтах
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def serve(size, orders, latency, rate_limit, connection):
+    async def main():
+        catalog = FakeCatalog(products=size, bundles=size, orders=orders)
+        async with FakeApiServer(catalog, latency=latency, rate_limit=rate_limit) as server:
+            connection.send(server.base_url)
+            # Работаем, пока родительский процесс не попросит остановиться
+            await asyncio.get_running_loop().run_in_executor(None, connection.recv)
+
+    asyncio.run(main())
+
+
+def make_clients(base_url, metrics, *names):
+    from async_colab_module import MoySklad, WB
+    from async_colab_module.fake_api import PREFIXES
+    from async_colab_module.ya_market import YM
+
+    url_map = {origin: base_url + prefix for origin, prefix in PREFIXES.items()}
+    classes = {'ms': MoySklad, 'wb': WB, 'ym': YM}
+    # Отдельный кэш, чтобы справочники не переиспользовались между сценариями
+    return [classes[name](api_key='token', url_map=url_map, metrics=metrics, cache=ResponseCache())
+            for name in names]
+
+
+async def bench_ms_pagination(base_url, metrics, size, orders):
+    ms_client, = make_clients(base_url, metrics, 'ms')
+    async with ms_client:
+        start = time.perf_counter()
+        products = await ms_client.get_with_pagination(f'{ms_client.host}entity/product', limit=1000)
+        return time.perf_counter() - start, len(products)
+
+
+async def bench_wb_prices(base_url, metrics, size, orders):
+    wb_client, = make_clients(base_url, metrics, 'wb')
+    async with wb_client:
+        start = time.perf_counter()
+        prices = await wb_client.get_product_prices()
+        return time.perf_counter() - start, len(prices or [])
+
+
+async def bench_ym_offers(base_url, metrics, size, orders):
+    from async_colab_module.ya_market import chunked_offers_list, get_dict_for_commission
+
+    ym_client, = make_clients(base_url, metrics, 'ym')
+    async with ym_client:
+        start = time.perf_counter()
+        offers = await ym_client.get_full_offers(2)
+        tariffs = await chunked_offers_list(get_dict_for_commission, ym_client=ym_client, campaign_id=1,
+                                            data=offers, chunk_size=200)
+        return time.perf_counter() - start, len(tariffs)
+
+
+async def bench_dict_for_report(base_url, metrics, size, orders):
+    from async_colab_module.utils import get_dict_for_report
+
+    ms_client, wb_client = make_clients(base_url, metrics, 'ms', 'wb')
+    async with ms_client, wb_client:
+        products = FakeCatalog(products=size, bundles=size).bundles
+        start = time.perf_counter()
+        base_dict = await get_dict_for_report(products, ms_client, wb_client)
+        return time.perf_counter() - start, len(base_dict['ms_stocks_dict'])
+
+
+async def get_fbo_inputs(base_url, metrics, size, orders):
+    from async_colab_module.utils import create_code_index, get_category_dict, get_price_dict
+
+    ms_client, wb_client = make_clients(base_url, metrics, 'ms', 'wb')
+    catalog = FakeCatalog(products=size, bundles=size, orders=orders)
+    async with ms_client, wb_client:
+        base_dict = {
+            'category_dict': await get_category_dict(wb_client),
+            'tariffs_data': await wb_client.get_tariffs_for_box(),
+            'wb_prices_dict': await get_price_dict(wb_client),
+            'ms_stocks_dict': {},
+        }
+    nm_ids_dict = create_code_index(catalog.bundles)
+    orders_ = [order for order in catalog.orders if not order['isCancel']]
+    return base_dict, nm_ids_dict, orders_
+
+
+async def bench_order_data_fbo(base_url, metrics, size, orders):
+    from async_colab_module.utils import get_order_data_fbo
+
+    base_dict, nm_ids_dict, orders_ = await get_fbo_inputs(base_url, metrics, size, orders)
+    start = time.perf_counter()
+    rows = [get_order_data_fbo(order, nm_ids_dict[order['nmId']], base_dict)
+            for order in orders_ if order['nmId'] in nm_ids_dict]
+    return time.perf_counter() - start, len(rows)
+
+
+async def bench_fbo_engine(base_url, metrics, size, orders):
+    from async_colab_module.fbo_report import get_orders_data_fbo
+
+    base_dict, nm_ids_dict, orders_ = await get_fbo_inputs(base_url, metrics, size, orders)
+    start = time.perf_counter()
+    df = get_orders_data_fbo(orders_, nm_ids_dict, base_dict)
+    return time.perf_counter() - start, len(df)
+
+
+async def bench_desired_prices(base_url, metrics, size, orders):
+    from async_colab_module.desired_price import get_desired_prices_data
+
+    ms_client, ym_client = make_clients(base_url, metrics, 'ms', 'ym')
+    async with ms_client, ym_client:
+        start = time.perf_counter()
+        rows = await get_desired_prices_data(ms_client, ym_client)
+        return time.perf_counter() - start, len(rows)
+
+
+SCENARIOS = {
+    'ms_pagination': bench_ms_pagination,
+    'wb_prices': bench_wb_prices,
+    'ym_offers': bench_ym_offers,
+    'dict_for_report': bench_dict_for_report,
+    'order_data_fbo': bench_order_data_fbo,
+    'fbo_engine': bench_fbo_engine,
+    'desired_prices': bench_desired_prices,
+}
+
+
+def run_scenario(name, base_url, size, orders):
+    import contextlib
+    import io
+    import logging
+
+    logging.disable(logging.INFO)
+    metrics = RequestMetrics()
+    # Сценарии печатают прогресс, в замерах он не нужен
+    with contextlib.redirect_stdout(io.StringIO()):
+        wall_time, items = asyncio.run(SCENARIOS[name](base_url, metrics, size, orders))
+    stats = [stats for hosts in metrics.to_dict().values() for stats in hosts.values()]
+    return {
+        'scenario': name,
+        'size': size,
+        'items': items,
+        'wall_time_s': round(wall_time, 3),
+        'peak_rss_mb': get_peak_rss_mb(),
+        'requests': sum(item['requests'] for item in stats),
+        'retries': sum(item['retries'] for item in stats),
+        'received_mb': round(sum(item['bytes_received'] for item in stats) / 2 ** 20, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='размеры каталога')
+    parser.add_argument('--orders', type=int, default=5000, help='количество заказов для order_data_fbo')
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа стенда, секунд')
+    parser.add_argument('--rate-limit', type=float, nargs=2, metavar=('REQUESTS', 'SECONDS'),
+                        help='лимит стенда на хост, сверх него ответ 429')
+    parser.add_argument('--json', help='сохранить результаты в JSON-файл')
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    header = f'{"scenario":<18}{"size":>8}{"items":>9}{"wall, s":>10}{"rss, MB":>10}{"requests":>10}' \
+             f'{"retries":>9}{"recv, MB":>10}'
+    print(header)
+    for size in args.sizes:
+        parent, child = context.Pipe()
+        server = context.Process(target=serve, args=(size, args.orders, args.latency, args.rate_limit, child))
+        server.start()
+        base_url = parent.recv()
+        try:
+            for name in args.scenarios:
+                with context.Pool(1, maxtasksperchild=1) as pool:
+                    result = pool.apply(run_scenario, (name, base_url, size, args.orders))
+                results.append(result)
+                print(f'{result["scenario"]:<18}{size:>8}{result["items"]:>9}{result["wall_time_s"]:>10.3f}'
+                      f'{result["peak_rss_mb"]:>10.1f}{result["requests"]:>10}{result["retries"]:>9}'
+                      f'{result["received_mb"]:>10.2f}', flush=True)
+        finally:
+            parent.send('stop')
+            server.join()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -3,10 +3,11 @@ from setuptools import setup, find_packages
 setup(
     name='async_colab_module',
     version='0.0.1',
-    packages=find_packages(),
-    install_requires=['asyncio', 'aiohttp', 'aiolimiter', 'ipywidgets', 'ipython', 'pandas', 'openpyxl'],
+    packages=find_packages(exclude=('benchmarks', 'benchmarks.*')),
+    install_requires=['asyncio', 'aiohttp', 'aiolimiter', 'ipywidgets', 'ipython', 'pandas', 'numpy', 'openpyxl'],
     extras_require={
         "dev": ["pytest",],
+        "fast": ["orjson",],
     },
     include_package_data=True,
     author='Lubentsov Artem',
@@ -0,0 +1,231 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+
+from async_colab_module.base import AsyncHttpClient
+from async_colab_module.breaker import CircuitBreaker, CircuitOpenError
+from async_colab_module.codec import JsonCodec, get_default_codec
+from async_colab_module.fake_api import FakeApiServer, FakeCatalog
+from async_colab_module.limiter import HostRateLimiter, RateLimiterRegistry, get_retry_after
+from async_colab_module.metrics import RequestMetrics, get_endpoint_template
+from async_colab_module.retry import RetryPolicy
+from async_colab_module.scheduler import BULK, INTERACTIVE, PrioritySemaphore, request_priority
+from async_colab_module.session import SessionRegistry
+
+
+def test_retry_after_headers():
+    assert get_retry_after({'Retry-After': '3'}) == 3.0
+    assert get_retry_after({'X-Ratelimit-Retry': '2'}) == 2.0
+    assert get_retry_after({'X-Lognex-Retry-After': '1500'}) == 1.5
+    assert get_retry_after({'Content-Type': 'application/json'}) is None
+
+
+def test_rate_limiter_adapts_to_headers():
+    limiter = HostRateLimiter(max_rate=10, time_period=1)
+    limiter.update(429, {'Retry-After': '0'})
+    assert limiter.rate == 5
+    limiter.update(200, {})
+    assert limiter.rate == 6
+
+    limiter.update(200, {'X-RateLimit-Limit': '45', 'X-Lognex-Retry-TimeInterval': '3000'})
+    assert (limiter.max_rate, limiter.time_period) == (45, 3)
+
+    limiter.update(200, {'X-Ratelimit-Remaining': '0', 'X-Ratelimit-Reset': '5'})
+    assert limiter.paused_until - time.monotonic() > 4
+
+
+def test_rate_limiter_pause_blocks_host_only():
+    registry = RateLimiterRegistry(max_rate=10, time_period=1)
+    registry.update('https://a.example/x', 200, {'X-Ratelimit-Remaining': '0', 'X-Ratelimit-Reset': '0.2'})
+
+    async def acquire(url):
+        start = time.monotonic()
+        async with registry.get(url):
+            return time.monotonic() - start
+
+    async def main():
+        return await asyncio.gather(acquire('https://a.example/y'), acquire('https://b.example/y'))
+
+    paused, free = asyncio.run(main())
+    assert paused >= 0.15
+    assert free < 0.1
+
+
+def test_retry_policy_delays():
+    policy = RetryPolicy(base_delay=1, max_delay=5, jitter=False)
+    assert [policy.get_delay(attempt) for attempt in range(4)] == [1, 2, 4, 5]
+    error = aiohttp.ClientResponseError(None, (), status=429, headers={'Retry-After': '7'})
+    assert policy.get_delay(0, error) == 7
+    assert policy.is_retryable(error)
+    assert policy.is_retryable(aiohttp.ServerDisconnectedError())
+    assert not policy.is_retryable(aiohttp.ClientResponseError(None, (), status=404))
+
+
+def test_retry_policy_budget():
+    calls = []
+
+    async def request():
+        calls.append(1)
+        raise aiohttp.ClientResponseError(None, (), status=502)
+
+    policy = RetryPolicy(max_attempts=5, base_delay=0.01, budget=0.025, jitter=False)
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(policy.call(request))
+    # Паузы 0.01 + 0.02 превышают бюджет, поэтому третьей попытки нет
+    assert len(calls) == 2
+
+
+def test_clients_share_session_per_loop():
+    registry = SessionRegistry()
+
+    async def main():
+        first = AsyncHttpClient(45, 3, session_registry=registry)
+        second = AsyncHttpClient(45, 3, session_registry=registry)
+        session = first.session
+        assert second.session is session
+        await first.close()
+        assert not session.closed
+        await second.close()
+        assert session.closed
+
+    asyncio.run(main())
+
+
+def test_identical_gets_are_coalesced():
+    client = AsyncHttpClient(45, 3)
+    calls = []
+
+    async def request(method, url, **kwargs):
+        calls.append((method, url, kwargs['params']))
+        await asyncio.sleep(0.01)
+        return {'rows': [1, 2]}
+
+    client._request = request
+
+    async def main():
+        return await asyncio.gather(client.get('https://a.example/stock', {'a': 1}),
+                                    client.get('https://a.example/stock', {'a': 1}),
+                                    client.get('https://a.example/stock', {'a': 2}))
+
+    first, second, third = asyncio.run(main())
+    assert first is second
+    assert len(calls) == 2
+    assert not client._inflight
+
+
+def test_codec_fallback_round_trip():
+    codec = JsonCodec()
+    body = codec.dumps({'offers': [{'price': 10.5, 'name': 'Товар'}]})
+    assert isinstance(body, bytes)
+    assert codec.loads(body) == {'offers': [{'price': 10.5, 'name': 'Товар'}]}
+    assert get_default_codec().loads(body) == codec.loads(body)
+
+
+def test_endpoint_templates():
+    assert get_endpoint_template('https://api.moysklad.ru/api/remap/1.2/entity/bundle?limit=100') == 'entity/bundle'
+    assert get_endpoint_template(
+        'https://api.partner.market.yandex.ru/businesses/123/offer-mappings') == 'businesses/{id}/offer-mappings'
+    assert get_endpoint_template(
+        'https://discounts-prices-api.wb.ru/api/v2/list/goods/filter') == 'list/goods/filter'
+
+
+def test_metrics_export():
+    metrics = RequestMetrics()
+    url = 'https://api.moysklad.ru/api/remap/1.2/entity/bundle'
+    for latency in (0.02, 0.2, 3.0):
+        metrics.observe(url, 'latency', latency)
+    metrics.count(url, 'bytes_received', 1024)
+    metrics.record_status(url, 200)
+
+    summary = metrics.to_dict()['api.moysklad.ru']['entity/bundle']
+    assert summary['latency']['count'] == 3
+    assert summary['latency']['p50'] == 0.25
+    assert summary['bytes_received'] == 1024
+    text = metrics.to_prometheus()
+    assert 'api_client_latency_seconds_bucket{host="api.moysklad.ru",endpoint="entity/bundle",le="+Inf"} 3' in text
+    assert 'api_client_responses_total{host="api.moysklad.ru",endpoint="entity/bundle",status="200"} 1' in text
+
+
+def test_circuit_breaker_states():
+    breaker = CircuitBreaker('host', failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    time.sleep(0.06)
+    # Полуоткрытое состояние: один пробный запрос, остальные отклоняются
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    time.sleep(0.06)
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert not CircuitBreaker.is_failure(aiohttp.ClientResponseError(None, (), status=429))
+
+
+def test_priority_semaphore_serves_interactive_first():
+    semaphore = PrioritySemaphore(1)
+    order = []
+
+    async def worker(name, priority):
+        with request_priority(priority):
+            async with semaphore:
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+    async def main():
+        await semaphore.acquire()
+        tasks = [asyncio.create_task(worker(f'bulk-{i}', BULK)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(worker('interactive', INTERACTIVE)))
+        await asyncio.sleep(0)
+        semaphore.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ['interactive', 'bulk-0', 'bulk-1', 'bulk-2']
+
+
+def test_client_serves_interactive_first_under_rate_limit():
+    order = []
+
+    async def get(client, url, offset, priority):
+        with request_priority(priority):
+            await client.get(url, {'offset': offset})
+        order.append(priority)
+
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10)) as server:
+            async with AsyncHttpClient(10, 1, semaphore=2) as client:
+                server.attach(client)
+                url = 'https://api.moysklad.ru/api/remap/1.2/entity/product'
+                bulk = [asyncio.create_task(get(client, url, i, BULK)) for i in range(15)]
+                await asyncio.sleep(0)
+                await get(client, url, 100, INTERACTIVE)
+                await asyncio.gather(*bulk)
+
+    asyncio.run(main())
+    # Лимит и семафор пропускают интерактивный запрос раньше большей части фоновых
+    assert order.index(INTERACTIVE) < 12
+
+
+def test_priority_semaphore_cancelled_waiter():
+    semaphore = PrioritySemaphore(1)
+
+    async def main():
+        await semaphore.acquire()
+        waiter = asyncio.create_task(semaphore.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        semaphore.release()
+        await asyncio.wait_for(semaphore.acquire(), 1)
+
+    asyncio.run(main())
@@ -0,0 +1,26 @@
+import random
+
+from async_colab_module.bundle_stock import BundleStockIndex
+from async_colab_module.fake_api import FakeCatalog
+from async_colab_module.utils import get_stock_for_bundle
+
+
+def test_matches_get_stock_for_bundle():
+    catalog = FakeCatalog(products=50, bundles=200, seed=3)
+    rnd = random.Random(1)
+    stocks = {stock['assortmentId']: stock['quantity'] for stock in catalog.stock[:40]}
+    stocks[catalog.products[0]['id']] = -3.0
+    bundles = catalog.bundles + [
+        {'code': '1', 'article': 'empty', 'components': {'rows': []}},
+        {'code': '2', 'article': 'variant', 'components': {'rows': [
+            {'quantity': 1.0, 'assortment': {'meta': {'href': 'https://api.moysklad.ru/api/remap/1.2/entity/variant/'
+                                                              'a1b2c3d4-0000-0000-0000-000000000000'}}}]}},
+    ]
+    index = BundleStockIndex(bundles)
+    expected = [get_stock_for_bundle(stocks, bundle) for bundle in bundles]
+    assert index.compute(stocks).tolist() == expected
+    assert index.to_dict(stocks, key='article') == {bundle['article']: stock for bundle, stock in zip(bundles, expected)}
+
+    # Пересчет после обновления остатков на том же индексе
+    stocks = {product_id: float(rnd.randint(0, 9)) for product_id in stocks}
+    assert index.compute(stocks).tolist() == [get_stock_for_bundle(stocks, bundle) for bundle in bundles]
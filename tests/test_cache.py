@@ -0,0 +1,48 @@
+import asyncio
+
+from async_colab_module.base import AsyncHttpClient
+from async_colab_module.cache import ResponseCache
+
+
+def test_cache_lru_and_ttl():
+    cache = ResponseCache(max_size=2)
+    cache.set('a', 'https://host/a', {'a': 1}, ttl=60)
+    cache.set('b', 'https://host/b', {'b': 1}, ttl=60)
+    cache.get('a')
+    cache.set('c', 'https://host/c', {'c': 1}, ttl=60)
+    assert cache.get('b') is None
+    assert cache.get('a') == {'a': 1}
+    cache.set('d', 'https://host/d', {'d': 1}, ttl=-1)
+    assert cache.get('d') is None
+
+
+def test_cache_persists_on_disk(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResponseCache(path=path)
+    key = cache.make_key('GET', 'https://host/tariffs/box', {'date': '2024-01-01'}, identity='token')
+    cache.set(key, 'https://host/tariffs/box', {'response': [1, 2]}, ttl=60)
+    cache.close()
+
+    restored = ResponseCache(path=path)
+    assert restored.get(key) == {'response': [1, 2]}
+    restored.invalidate('tariffs/box')
+    assert restored.get(key) is None
+
+
+def test_client_caches_configured_endpoints():
+    client = AsyncHttpClient(45, 3, cache=ResponseCache(), cache_ttls={'tariffs': 60})
+    calls = []
+
+    async def request(method, url, **kwargs):
+        calls.append(url)
+        return {'url': url}
+
+    client._request = request
+
+    async def main():
+        for _ in range(2):
+            await client.get('https://host/tariffs/box')
+            await client.get('https://host/orders')
+
+    asyncio.run(main())
+    assert calls == ['https://host/tariffs/box', 'https://host/orders', 'https://host/orders']
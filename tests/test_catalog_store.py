@@ -0,0 +1,112 @@
+import asyncio
+
+from async_colab_module import MoySklad, WB
+from async_colab_module.catalog_store import CatalogStore
+from async_colab_module.fake_api import FakeApiServer, FakeCatalog
+from async_colab_module.ya_market import YM
+
+
+def test_store_refresh_and_lookups(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    catalog = FakeCatalog(products=30, bundles=20)
+
+    async def main():
+        async with FakeApiServer(catalog) as server:
+            async with MoySklad(api_key='token') as ms_client, WB(api_key='token') as wb_client, \
+                    YM(api_key='token') as ym_client:
+                server.attach(ms_client, wb_client, ym_client)
+                store = CatalogStore(path)
+                await store.start_refresh(ms_client, wb_client, ym_client, business_id=2)
+                store.close()
+
+                # Повторный запуск: данные доступны сразу, обновление загружает только изменения
+                store = CatalogStore(path)
+                server.request_counts.clear()
+                await store.refresh(ms_client)
+                return store, dict(server.request_counts)
+
+    store, counts = asyncio.run(main())
+    assert store.count('product') == 30 and store.count('bundle') == 20
+    assert store.find_by_article('B-3')[0]['code'] == '10000003'
+    assert store.find_by_code(100005, entity='product')[0]['article'] == 'P-5'
+    assert store.get_wb_price(10000007)['vendorCode'] == 'B-7'
+    assert store.get_ym_offer('B-1')['offer']['offerId'] == 'B-1'
+    assert len(store.ym_offers(2)) == 10
+    assert store.get_checkpoint('product') == '2024-01-01 00:00:00'
+    assert store.age('wb:prices') < 60
+    # Одна страница изменений и две проверки количества
+    assert counts[('GET', '/ms/api/remap/1.2/entity/bundle')] == 3
+    store.close()
+
+
+def test_store_as_snapshot():
+    store = CatalogStore()
+    store.upsert('product', [{'id': 'a', 'article': 'A'}, {'id': 'b', 'article': 'B'}])
+    store.delete('product', ['a'])
+    store.set_checkpoint('product', '2024-01-01 00:00:00')
+    assert store.ids('product') == {'b'}
+    assert store.rows('product') == [{'id': 'b', 'article': 'B'}]
+    assert store.get_checkpoint('product') == '2024-01-01 00:00:00'
+    assert store.find_by_article('A') == []
+    store.close()
+
+
+def test_wb_orders_feed(tmp_path):
+    path = str(tmp_path / 'orders.db')
+    catalog = FakeCatalog(products=10, bundles=10, orders=120)
+    statistics_limit = {'statistics-api.wildberries.ru': (100, 1)}
+
+    async def main():
+        async with FakeApiServer(catalog) as server:
+            server.orders_page_size = 50
+            async with WB(api_key='token', host_limits=statistics_limit) as wb_client:
+                server.attach(wb_client)
+                wb_client.orders_page_size = 50
+                day_orders = await wb_client.get_orders(catalog.orders[0]['date'][:10])
+                store = CatalogStore(path)
+                await store.sync_wb_orders(wb_client, '2024-01-01T00:00:00')
+                first_count = server.request_counts[('GET', '/wb-statistics/api/v1/supplier/orders')]
+                store.close()
+
+                catalog.orders.append({**catalog.orders[-1], 'srid': 'new', 'lastChangeDate': '2024-03-01T00:00:00'})
+                store = CatalogStore(path)
+                await store.sync_wb_orders(wb_client, '2024-01-01T00:00:00')
+                second_count = server.request_counts[('GET', '/wb-statistics/api/v1/supplier/orders')] - first_count
+            return store, day_orders, first_count, second_count
+
+    store, day_orders, first_count, second_count = asyncio.run(main())
+    assert isinstance(day_orders, list) and day_orders
+    assert WB(api_key='token').rate_limiters.get('https://statistics-api.wildberries.ru/x').max_rate == 1
+    # 120 заказов страницами по 50 (с повтором граничной отметки), затем только новые изменения
+    assert first_count - 1 == 3
+    assert second_count == 1
+    orders = store.wb_orders()
+    assert len(orders) == 121
+    window = store.wb_orders('2024-01-05T00:00:00', '2024-01-10T00:00:00')
+    assert window and all('2024-01-05' <= order['date'] < '2024-01-10' for order in window)
+    assert store.get_state('wb:orders')[0] == '2024-03-01T00:00:00'
+    store.close()
+
+
+def test_store_keeps_wb_prices_on_incomplete_listing():
+    from async_colab_module.utils import get_price_dict
+
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10, bundles=2500)) as server:
+            async with WB(api_key='token') as wb_client:
+                server.attach(wb_client)
+                store = CatalogStore()
+                await store.refresh(wb_client=wb_client)
+                get_direct = wb_client.get_direct
+
+                async def failing_page(url, params=None, **kwargs):
+                    # Средняя страница из трех не загружается
+                    return None if params['offset'] == 1000 else await get_direct(url, params, **kwargs)
+
+                wb_client.get_direct = failing_page
+                prices = await wb_client.get_product_prices()
+                await store.refresh(wb_client=wb_client)
+                price_index = await get_price_dict(wb_client, store=store)
+            return prices, len(store.wb_prices()), len(price_index)
+
+    assert asyncio.run(main()) == (None, 2500, 2500)
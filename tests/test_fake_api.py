@@ -0,0 +1,408 @@
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+
+from async_colab_module import MoySklad, WB
+from async_colab_module.base import AsyncHttpClient
+from async_colab_module.breaker import CircuitBreakerRegistry
+from async_colab_module.cache import ResponseCache
+from async_colab_module.catalog_store import CatalogStore
+from async_colab_module.catalog_sync import CatalogSnapshot
+from async_colab_module.fake_api import FakeApiServer, FakeCatalog
+from async_colab_module.json_stream import project_fields
+from async_colab_module.retry import RetryPolicy
+from async_colab_module.scheduler import BULK, INTERACTIVE, request_priority
+from async_colab_module.ya_market import YM, chunked_offers_list, get_dict_for_commission
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_moysklad_pagination_and_stock():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=250, bundles=120)) as server:
+            async with MoySklad(api_key='token') as ms_client:
+                server.attach(ms_client)
+                products = await ms_client.get_products_list()
+                bundles = await ms_client.get_bundles()
+                stocks = await ms_client.get_stock_dict()
+            return server, products, bundles, stocks
+
+    server, products, bundles, stocks = run(main())
+    assert len(products) == 250
+    assert len(bundles) == 120
+    assert 'name' in bundles[0]['components']['rows'][0]['assortment']
+    assert len(stocks) == 250
+    # Размер берется из первой страницы: без пробного запроса и лишней пустой страницы
+    assert server.request_counts[('GET', '/ms/api/remap/1.2/entity/bundle')] == 2
+    assert [product['id'] for product in products] == [product['id'] for product in server.catalog.products]
+
+
+def test_moysklad_page_streaming():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=95)) as server:
+            async with MoySklad(api_key='token') as ms_client:
+                server.attach(ms_client)
+                url = f'{ms_client.host}entity/product'
+                get_page_rows = ms_client.get_page_rows
+
+                async def failing_page(url, limit, offset, *args):
+                    return None if offset == 40 else await get_page_rows(url, limit, offset, *args)
+
+                ms_client.get_page_rows = failing_page
+                streamed = [row['id'] async for row in ms_client.iter_with_pagination(url, limit=10, max_in_flight=3)]
+                collected = await ms_client.get_with_pagination(url, limit=10)
+                del ms_client.get_page_rows
+                first = None
+                async for row in ms_client.iter_with_pagination(url, limit=10):
+                    first = row
+                    break
+            return server, streamed, collected, first
+
+    server, streamed, collected, first = run(main())
+    ids = [product['id'] for product in server.catalog.products]
+    # Сбойная страница пропускается с ошибкой в логе, остальные строки отдаются
+    assert sorted(streamed) == sorted(ids[:40] + ids[50:])
+    assert [row['id'] for row in collected] == ids[:40] + ids[50:]
+    assert first['id'] == ids[0]
+
+
+def test_moysklad_projected_page_empty_or_failed():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10)) as server:
+            retry_policy = RetryPolicy(max_attempts=2, base_delay=0.01)
+            async with MoySklad(api_key='token', retry_policy=retry_policy) as ms_client:
+                server.attach(ms_client)
+                url = f'{ms_client.host}entity/product'
+                project = project_fields('id')
+                # Страница за концом списка - пустая, но не сбойная
+                empty = await ms_client.get_page_rows(url, 10, 100, project)
+                server.error_rate = 1.0
+                failed = await ms_client.get_page_rows(url, 10, 0, project)
+            return empty, failed
+
+    assert run(main()) == ([], None)
+
+
+def test_rate_limited_server_is_retried():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10), rate_limit=(3, 0.2)) as server:
+            retry_policy = RetryPolicy(max_attempts=10, base_delay=0.01)
+            async with MoySklad(api_key='token', max_rete=100, time_period=1, retry_policy=retry_policy) as ms_client:
+                server.attach(ms_client)
+                pages = await asyncio.gather(*[ms_client.get(f'{ms_client.host}entity/product', {'offset': i})
+                                               for i in range(8)])
+                return pages, ms_client.metrics.to_dict()
+
+    pages, metrics = run(main())
+    assert all(page and len(page['rows']) for page in pages)
+    assert metrics['api.moysklad.ru']['entity/product']['statuses'].get(429)
+
+
+def test_wb_and_ym_flows():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=40, bundles=30)) as server:
+            async with WB(api_key='token', cache=ResponseCache()) as wb_client, \
+                    YM(api_key='token', cache=ResponseCache()) as ym_client:
+                server.attach(wb_client, ym_client)
+                prices = await wb_client.get_product_prices()
+                commission = await wb_client.get_commission()
+                offers = await ym_client.get_full_offers(2)
+                tariffs = await chunked_offers_list(get_dict_for_commission, ym_client=ym_client, campaign_id=1,
+                                                    data=offers, chunk_size=4)
+                return prices, commission, offers, tariffs
+
+    prices, commission, offers, tariffs = run(main())
+    assert len(prices) == 30
+    assert commission['report']
+    assert len(offers) == 15
+    assert len(tariffs) == 15
+    assert all(tariff['FEE']['percent'] == 5.0 for tariff in tariffs.values())
+
+
+def test_recorded_response_overrides_catalog():
+    async def main():
+        async with FakeApiServer() as server:
+            server.add_response('GET', '/ms/api/remap/1.2/report/stock/all/current',
+                                [{'assortmentId': 'a', 'quantity': 3.0}])
+            async with MoySklad(api_key='token') as ms_client:
+                server.attach(ms_client)
+                return await ms_client.get_stock()
+
+    assert run(main()) == [{'assortmentId': 'a', 'quantity': 3.0}]
+
+
+def test_circuit_breaker_fails_fast_on_degraded_host():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10), error_rate=1.0) as server:
+            retry_policy = RetryPolicy(max_attempts=5, base_delay=0.01)
+            breakers = CircuitBreakerRegistry(failure_threshold=3, reset_timeout=60)
+            async with MoySklad(api_key='token', retry_policy=retry_policy, breakers=breakers) as ms_client:
+                server.attach(ms_client)
+                results = await asyncio.gather(*[ms_client.get(f'{ms_client.host}entity/product', {'offset': i})
+                                                 for i in range(20)])
+            return results, sum(server.request_counts.values())
+
+    results, requests = run(main())
+    assert results == [None] * 20
+    # Без предохранителя было бы 20 * 5 запросов
+    assert requests < 20
+
+
+def test_paused_host_does_not_hold_semaphore():
+    async def timed(coroutine):
+        start = time.monotonic()
+        result = await coroutine
+        return result, time.monotonic() - start
+
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10)) as server:
+            async with AsyncHttpClient(45, 3, semaphore=1) as client:
+                server.attach(client)
+                ms_url = 'https://api.moysklad.ru/api/remap/1.2/entity/product'
+                client.rate_limiters.update(ms_url, 200, {'X-Lognex-Retry-After': '500'})
+                ms_requests = [asyncio.ensure_future(timed(client.get(ms_url, {'offset': i}))) for i in range(3)]
+                await asyncio.sleep(0)
+                wb_result = await timed(client.get('https://common-api.wildberries.ru/api/v1/tariffs/commission'))
+                return wb_result, await asyncio.gather(*ms_requests)
+
+    (commission, wb_time), ms_results = run(main())
+    assert commission and wb_time < 0.3
+    assert all(result['rows'] and elapsed >= 0.4 for result, elapsed in ms_results)
+
+
+def test_interactive_request_overtakes_bulk_under_rate_limit():
+    finished = []
+
+    async def fetch(client, url, name, priority):
+        with request_priority(priority):
+            start = time.monotonic()
+            async with client.send('GET', url) as response:
+                await response.read()
+            finished.append(name)
+            return time.monotonic() - start
+
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10)) as server:
+            async with AsyncHttpClient(5, 1, semaphore=2) as client:
+                server.attach(client)
+                url = 'https://api.moysklad.ru/api/remap/1.2/entity/product'
+                bulk = [asyncio.ensure_future(fetch(client, url, i, BULK)) for i in range(15)]
+                await asyncio.sleep(0)
+                waited = await fetch(client, url, 'interactive', INTERACTIVE)
+                await asyncio.gather(*bulk)
+                return waited
+
+    waited = run(main())
+    # Лимит 5 запросов в секунду: интерактивный запрос получает следующий токен после уже выданных
+    assert waited < 1
+    assert finished.index('interactive') < 10
+
+
+def test_cancelled_half_open_probe_releases_breaker():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10), latency=0.5) as server:
+            breakers = CircuitBreakerRegistry(failure_threshold=1, reset_timeout=0.01)
+            async with MoySklad(api_key='token', breakers=breakers) as ms_client:
+                server.attach(ms_client)
+                url = f'{ms_client.host}entity/product'
+                breaker = breakers.get(url)
+                breaker.record_failure()
+                await asyncio.sleep(0.02)
+                # Пробный запрос отменяется по таймауту, не дождавшись ответа
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(ms_client._request('GET', url), 0.05)
+                assert breaker.state == 'half_open' and breaker.probes == 0
+                server.latency = 0
+                result = await ms_client.get(url)
+                return result, breaker.state
+
+    result, state = run(main())
+    assert result['rows'] and state == 'closed'
+
+
+def test_incremental_catalog_sync(tmp_path):
+    path = str(tmp_path / 'catalog.json')
+    catalog = FakeCatalog(products=250, bundles=20)
+
+    async def sync(server, snapshot):
+        async with MoySklad(api_key='token') as ms_client:
+            server.attach(ms_client)
+            server.request_counts.clear()
+            products = await ms_client.get_products_list(snapshot=snapshot)
+            bundles = await ms_client.get_bundles(snapshot=snapshot)
+        return products, bundles, dict(server.request_counts)
+
+    async def main():
+        async with FakeApiServer(catalog) as server:
+            first = await sync(server, CatalogSnapshot(path))
+            changed = catalog.products[10]
+            changed.update(name='Новое имя', updated='2024-02-01 12:00:00.500')
+            added = {**catalog.products[0], 'id': 'new-product', 'updated': '2024-02-02 00:00:00.000'}
+            catalog.products.append(added)
+            del catalog.products[20:22]
+            second = await sync(server, CatalogSnapshot(path))
+            third = await sync(server, CatalogSnapshot(path))
+            return first, second, third
+
+    first, second, third = run(main())
+    assert len(first[0]) == 250 and len(first[1]) == 20
+    products, bundles, counts = second
+    assert {product['id'] for product in products} == {product['id'] for product in catalog.products}
+    assert next(product for product in products if product['id'] == catalog.products[10]['id'])['name'] == 'Новое имя'
+    assert len(bundles) == 20
+    # Изменения - одна страница, проверка количества и один проход по id из-за удаленных товаров
+    assert counts[('GET', '/ms/api/remap/1.2/entity/product')] == 1 + 2 + 1
+    assert len(third[0]) == 249
+    assert third[2][('GET', '/ms/api/remap/1.2/entity/product')] == 1 + 2
+
+
+def test_bundles_resolved_from_product_index():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=200, bundles=150)) as server:
+            async with MoySklad(api_key='token') as ms_client:
+                server.attach(ms_client)
+                products = await ms_client.get_products_list()
+                server.bytes_sent = 0
+                expanded = await ms_client.get_bundles()
+                expanded_bytes, server.bytes_sent = server.bytes_sent, 0
+                resolved = await ms_client.get_bundles(products=products)
+                return expanded, resolved, expanded_bytes, server.bytes_sent
+
+    expanded, resolved, expanded_bytes, resolved_bytes = run(main())
+    assert resolved == expanded
+    assert resolved_bytes < expanded_bytes
+
+
+def test_wb_prices_prefetch():
+    async def load(bundles, prefetch):
+        async with FakeApiServer(FakeCatalog(products=10, bundles=bundles), latency=0.01) as server:
+            async with WB(api_key='token') as wb_client:
+                server.attach(wb_client)
+                goods = [item async for item in wb_client.iter_product_prices(limit=10, prefetch=prefetch)]
+        return [item['nmID'] for item in goods], server.request_counts[('GET', '/wb-prices/api/v2/list/goods/filter')]
+
+    async def main():
+        return [await load(bundles, prefetch) for bundles, prefetch in ((8, 3), (25, 3), (30, 3), (25, 1), (30, 1))]
+
+    results = run(main())
+    for (goods, _), bundles in zip(results, (8, 25, 30, 25, 30)):
+        assert goods == [10000000 + i for i in range(bundles)]
+    # Каталог на одну страницу - один запрос, следующие страницы запрашиваются только после полной
+    assert results[0][1] == 1
+    # Без запросов наперед: страницы до первой неполной (25 товаров) или пустой (30 товаров)
+    assert results[3][1] == 3
+    assert results[4][1] == 4
+
+
+def test_wb_orders_fbs_iterator():
+    start = int(datetime(2024, 1, 1).timestamp())
+    end = int(datetime(2024, 2, 1).timestamp())
+
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10, bundles=10, fbs_orders=950)) as server:
+            async with WB(api_key='token') as wb_client:
+                server.attach(wb_client)
+                serial = [order['id'] async for order in wb_client.iter_orders_fbs(start, end, limit=100)]
+                windowed = [order['id'] async for order in
+                            wb_client.iter_orders_fbs(start, end, window=7 * 24 * 3600, limit=100)]
+                # Прерванная выгрузка продолжается с сохраненных курсоров окон
+                store = CatalogStore()
+                first = []
+                orders = wb_client.iter_orders_fbs(start, end, window=7 * 24 * 3600, store=store, limit=100, buffer=1)
+                async for order in orders:
+                    first.append(order['id'])
+                    if len(first) == 300:
+                        break
+                await orders.aclose()
+                rest = [order['id'] async for order in
+                        wb_client.iter_orders_fbs(start, end, window=7 * 24 * 3600, store=store, limit=100)]
+                again = [order async for order in
+                         wb_client.iter_orders_fbs(start, end, window=7 * 24 * 3600, store=store, limit=100)]
+            return server.catalog, serial, windowed, first, rest, again
+
+    catalog, serial, windowed, first, rest, again = run(main())
+    ids = sorted(order['id'] for order in catalog.fbs_orders)
+    # 950 заказов при limit=100: последняя неполная страница не теряется
+    assert serial == ids
+    assert sorted(windowed) == ids
+    assert set(first) | set(rest) == set(ids)
+    # Повторно выдается только страница, на которой выгрузка прервалась
+    assert len(set(first) & set(rest)) <= 100
+    assert again == []
+
+
+def test_wb_orders_fbs_open_window_resumes_from_cursor():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10, bundles=10, fbs_orders=50)) as server:
+            async with WB(api_key='token') as wb_client:
+                server.attach(wb_client)
+                store = CatalogStore()
+                future = int(time.time()) + 24 * 3600
+                first = [order['id'] async for order in wb_client.iter_orders_fbs(store=store, limit=20)]
+                window = [order['id'] async for order in wb_client.iter_orders_fbs(0, future, store=store, limit=20)]
+                server.catalog.fbs_orders.append({**server.catalog.fbs_orders[-1], 'id': 5000, 'rid': 'rid-new'})
+                # Окна без dateTo и с dateTo в будущем не закрываются: новый заказ попадает в выдачу
+                second = [order['id'] async for order in wb_client.iter_orders_fbs(store=store, limit=20)]
+                window_second = [order['id'] async for order in
+                                 wb_client.iter_orders_fbs(0, future, store=store, limit=20)]
+            return first, window, second, window_second
+
+    first, window, second, window_second = run(main())
+    assert len(first) == len(window) == 50
+    assert second == window_second == [5000]
+
+
+def test_wb_orders_fbs_error_ends_iteration():
+    async def main():
+        async with FakeApiServer() as server:
+            # Ответ не того формата: ошибка разбора в окне должна дойти до потребителя, а не повесить его
+            server.add_response('GET', '/wb-suppliers/api/v3/orders', [{'id': 1}])
+            async with WB(api_key='token') as wb_client:
+                server.attach(wb_client)
+                await asyncio.wait_for(wb_client.get_orders_fbs(0, 7 * 24 * 3600, window=24 * 3600), 5)
+
+    with pytest.raises(AttributeError):
+        run(main())
+
+
+def test_wb_upload_prices():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10, bundles=30)) as server:
+            async with WB(api_key='token') as wb_client:
+                server.attach(wb_client)
+                updates = [{'nmID': 10000000 + i, 'price': 1000 + i, 'discount': 10} for i in range(30)]
+                updates[3]['price'] = 0
+                updates.append({'nmID': 1, 'price': 100, 'discount': 0})
+                report = await wb_client.upload_prices(updates, batch_size=8, poll_interval=0.02, timeout=5)
+                prices = await wb_client.get_product_prices()
+            return server, report, prices
+
+    server, report, prices = run(main())
+    assert server.request_counts[('POST', '/wb-prices/api/v2/upload/task')] == 4
+    assert sorted(report['tasks'].values()) == [3, 3, 5, 5]
+    assert sorted((item['nmID'], item['errorText']) for item in report['errors']) == [
+        (1, 'Товар не найден'), (10000003, 'Цена должна быть больше 0')]
+    assert report['rejected'] == []
+    assert prices[5]['sizes'][0]['discountedPrice'] == 1005 * 0.9
+
+
+def test_wb_upload_prices_rejected_batch():
+    async def main():
+        async with FakeApiServer(FakeCatalog(products=10, bundles=10)) as server:
+            server.add_response('POST', '/wb-prices/api/v2/upload/task',
+                                {'data': None, 'error': True, 'errorText': 'Invalid nmID'}, status=400)
+            async with WB(api_key='token') as wb_client:
+                server.attach(wb_client)
+                updates = [{'nmID': 10000000 + i, 'price': 1000, 'discount': 10} for i in range(3)]
+                report = await wb_client.upload_prices(updates, poll_interval=0.02, timeout=5)
+            return server, report
+
+    server, report = run(main())
+    # Отказ 4xx не повторяется, причина из тела ответа попадает в отчет
+    assert server.request_counts[('POST', '/wb-prices/api/v2/upload/task')] == 1
+    assert report['tasks'] == {}
+    assert [item['errorText'] for item in report['rejected']] == ['Invalid nmID'] * 3
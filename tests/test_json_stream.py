@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from async_colab_module.json_stream import JsonArrayStream, project_fields
+
+
+def feed_by_chunks(parser, raw, size):
+    items = []
+    for i in range(0, len(raw), size):
+        items += parser.feed(raw[i: i + size])
+    return items + parser.close()
+
+
+@pytest.mark.parametrize('size', [1, 7, 4096])
+def test_stream_rows_of_page(size):
+    page = {
+        'context': {'employee': {'meta': {'href': 'https://host/rows]'}}},
+        'meta': {'size': 3, 'limit': 1000},
+        'rows': [{'id': i, 'name': f'Товар "{i}"', 'quantity': i * 1.5} for i in range(50)],
+    }
+    raw = json.dumps(page, ensure_ascii=False).encode()
+    assert feed_by_chunks(JsonArrayStream('rows'), raw, size) == page['rows']
+
+
+@pytest.mark.parametrize('size', [1, 3])
+def test_stream_top_level_array(size):
+    stock = [{'assortmentId': 'a', 'quantity': 12345}, {'assortmentId': 'b', 'quantity': -2}]
+    raw = json.dumps(stock).encode()
+    project = project_fields('quantity')
+    assert [project(item) for item in feed_by_chunks(JsonArrayStream(), raw, size)] == [
+        {'quantity': 12345}, {'quantity': -2}]
+
+
+def test_stream_numbers_split_at_chunk_boundary():
+    page = {'meta': {'size': 2.5e3}, 'total': -12.75, 'rows': [12.5, 1.5e-3, -7, 0.25, 3E+2, {'q': 10.125}]}
+    raw = json.dumps(page)
+    # Разрез в каждой позиции, в том числе сразу после точки и после e
+    for cut in range(1, len(raw)):
+        parser = JsonArrayStream('rows')
+        assert parser.feed(raw[:cut]) + parser.feed(raw[cut:]) + parser.close() == page['rows']
+    top_level = '[12.5, 1.5e10, 7]'
+    for cut in range(1, len(top_level)):
+        parser = JsonArrayStream()
+        assert parser.feed(top_level[:cut]) + parser.feed(top_level[cut:]) + parser.close() == [12.5, 1.5e10, 7]
+
+
+def test_stream_incomplete_body():
+    parser = JsonArrayStream()
+    parser.feed(b'[{"a": 1}, {"a"')
+    with pytest.raises(ValueError):
+        parser.close()
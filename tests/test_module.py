@@ -1,6 +1,5 @@
 import asyncio
 
-import aiohttp
 import pytest
 from datetime import datetime, timedelta
 
@@ -34,13 +33,16 @@ def ms_client():
 #     bundles = ms_client.get_bundles()
 #     assert len(bundles) > 1
 
-async def test_get_bundles(ms_client):
-    async with aiohttp.ClientSession() as session:
-        bundles = await ms_client.get_bundles(session)
-        print(bundles)
-        assert len(bundles) > 1
+# Обращается к реальному API, без токена пропускается. Офлайн-тесты - в test_fake_api.py
+@pytest.mark.skipif(not ms_token, reason='Не задан MS_API_TOKEN')
+def test_get_bundles(ms_client):
+    async def main():
+        async with ms_client:
+            return await ms_client.get_bundles()
+
+    bundles = asyncio.run(main())
+    assert len(bundles) > 1
 
-asyncio.run(test_get_bundles(ms_client))
 # def test_wb_get_commission(wb_client):
 #     commission = wb_client.get_commission()
 #     assert commission
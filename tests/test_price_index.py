@@ -0,0 +1,29 @@
+from async_colab_module.fake_api import FakeCatalog
+from async_colab_module.price_index import WBPriceIndex
+from async_colab_module.utils import create_code_index, get_order_data_fbo
+
+
+def test_index_covers_all_sizes():
+    catalog = FakeCatalog(products=20, bundles=20)
+    index = WBPriceIndex(catalog.wb_goods)
+    # Прежний словарь: только товары с одним размером
+    old_dict = {d['nmID']: {'price': d['sizes'][0]['discountedPrice'], 'discount': d['discount']}
+                for d in catalog.wb_goods if len(d['sizes']) == 1}
+    assert len(index) == 20
+    assert all(index.get(nm_id) == value for nm_id, value in old_dict.items())
+
+    multi = catalog.wb_goods[0]
+    assert [size['techSize'] for size in index.sizes(multi['nmID'])] == ['S', 'M', 'L']
+    assert index.get_size(multi['nmID'], 'M')['price'] == multi['sizes'][1]['discountedPrice']
+    assert index.get_size(multi['nmID'], 'XXL') == index.get(multi['nmID'])
+    assert index.get(1) is None and 1 not in index
+
+
+def test_order_uses_size_price():
+    catalog = FakeCatalog(products=20, bundles=20)
+    multi = catalog.wb_goods[0]
+    base_dict = {'wb_prices_dict': WBPriceIndex(catalog.wb_goods), 'tariffs_data': catalog.tariffs_box,
+                 'category_dict': {}, 'ms_stocks_dict': {}}
+    product = create_code_index(catalog.bundles)[multi['nmID']]
+    order = {'nmId': multi['nmID'], 'techSize': 'L', 'warehouseName': 'Коледино', 'finishedPrice': 100.0}
+    assert get_order_data_fbo(order, product, base_dict)['item_price'] == multi['sizes'][2]['discountedPrice']
@@ -0,0 +1,58 @@
+from async_colab_module.fake_api import FakeCatalog
+from async_colab_module.utils import TariffIndex, get_logistic_dict, get_tariff_index
+
+
+def test_tariff_index_matches_logistic_dict():
+    catalog = FakeCatalog(products=5, bundles=5)
+    index = TariffIndex(catalog.tariffs_box)
+    for name in ('Коледино', 'Казань', 'Маркетплейс', 'Неизвестный склад'):
+        assert index[name] == get_logistic_dict(catalog.tariffs_box, warehouse_name=name)
+    base_dict = {'tariffs_data': catalog.tariffs_box}
+    assert get_tariff_index(base_dict) is get_tariff_index(base_dict)
+
+
+def test_vectorized_fbo_matches_rows():
+    import random
+
+    import pandas as pd
+
+    from async_colab_module.fbo_report import get_orders_data_fbo
+    from async_colab_module.price_index import WBPriceIndex
+    from async_colab_module.utils import create_code_index, get_order_data_fbo
+
+    catalog = FakeCatalog(products=50, bundles=60, orders=3000, seed=5)
+    rnd = random.Random(2)
+    orders = catalog.orders + [{**order, 'finishedPrice': rnd.randint(0, 100000) / 20} for order in catalog.orders]
+    del orders[1]['subject'], orders[2]['warehouseName']
+    goods = [goods for n, goods in enumerate(catalog.wb_goods) if n % 7]
+    base_dict = {'wb_prices_dict': WBPriceIndex(goods), 'tariffs_data': catalog.tariffs_box,
+                 'category_dict': {'Посуда': 12, 'Игрушки': 17.5}, 'ms_stocks_dict': {10000001: 4}}
+    nm_ids_dict = create_code_index(catalog.bundles[:50])
+
+    expected = pd.DataFrame([get_order_data_fbo(order, nm_ids_dict[order['nmId']], base_dict)
+                             for order in orders if order['nmId'] in nm_ids_dict])
+    result = get_orders_data_fbo(orders, nm_ids_dict, base_dict)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_exact=True)
+    assert get_orders_data_fbo([], nm_ids_dict, base_dict).empty
+
+
+def test_product_records_match_raw_products():
+    import pandas as pd
+
+    from async_colab_module.fbo_report import get_orders_data_fbo
+    from async_colab_module.utils import ProductRecord, create_code_index, create_record_index, get_order_data_fbo
+
+    catalog = FakeCatalog(products=30, bundles=40, orders=500, seed=3)
+    base_dict = {'wb_prices_dict': {}, 'tariffs_data': catalog.tariffs_box}
+    nm_ids_dict = create_code_index(catalog.bundles)
+    records = create_record_index(catalog.bundles)
+    assert records.keys() == nm_ids_dict.keys()
+    record = next(iter(records.values()))
+    assert isinstance(record, ProductRecord) and not hasattr(record, '__dict__')
+
+    orders = [order for order in catalog.orders if order['nmId'] in nm_ids_dict]
+    for order in orders[:50]:
+        assert (get_order_data_fbo(order, records[order['nmId']], base_dict)
+                == get_order_data_fbo(order, nm_ids_dict[order['nmId']], base_dict))
+    pd.testing.assert_frame_equal(get_orders_data_fbo(orders, records, base_dict),
+                                  get_orders_data_fbo(orders, nm_ids_dict, base_dict))